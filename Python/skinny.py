@@ -1,11 +1,527 @@
 from __future__ import print_function
 from array import array
-from operator import xor
+from operator import attrgetter, itemgetter
+from collections import OrderedDict
+from copy import copy
+from functools import partial
+from struct import Struct
+from sys import getsizeof
+from threading import Lock, local
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 __author__ = 'inmcm'
 
 
-class SkinnyCipher:
+class KeyScheduleCache:
+    """
+    Thread safe LRU cache of expanded key schedules shared by every SkinnyCipher in the process.
+    Entries are keyed by (key, key_size, block_size) and hold the key schedule list, which must be
+    treated as read only by the ciphers sharing it.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        """
+        Initialize an empty key schedule cache.
+        :param max_entries: Int maximum number of cached schedules, None for no entry limit
+        :param max_bytes: Int maximum approximate memory held by cached schedules, None for no byte limit
+        :return: None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def schedule_size(self, key_schedule):
+        return getsizeof(key_schedule)
+
+    def get(self, key_id):
+        with self.lock:
+            try:
+                key_schedule, size = self.entries[key_id]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key_id)
+            self.hits += 1
+            return key_schedule
+
+    def put(self, key_id, key_schedule):
+        size = self.schedule_size(key_schedule)
+        with self.lock:
+            if key_id in self.entries:
+                self.size -= self.entries.pop(key_id)[1]
+            self.entries[key_id] = (key_schedule, size)
+            self.size += size
+
+            # Evict least recently used schedules until both limits hold again
+            while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+                                    (self.max_bytes is not None and self.size > self.max_bytes)):
+                self.size -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class UnrolledCodeCache(KeyScheduleCache):
+    """
+    LRU cache of the generated (encrypt_block, decrypt_block) pairs of the unrolled engine,
+    keyed by (key, key_size, block_size, rounds).
+    """
+
+    def schedule_size(self, functions):
+        return sum(getsizeof(function.__code__.co_code) + getsizeof(function.__code__.co_consts)
+                   for function in functions)
+
+
+class SkinnyKeySchedule:
+    """
+    Tweakey schedule computed round by round on demand. Round r is reached directly instead of by running
+    the r rounds before it: the tweakey permutation has period 16, and as every cell moves between the
+    top and bottom half each round, the cells of round r went through the LFSR ceil(r / 2) times.
+    Computed round keys are kept as 8 cells per round in one flat bytearray.
+    Indexing gives rows 0 and 1 of a round tweakey as a pair of arrays, like a list of expanded round keys.
+    """
+
+    # Per tweakey permutation power r (0 to 15), getter of the cells of a word found at positions 0 to 7
+    # after r rounds
+    permutation_powers = []
+
+    # LFSR powers as byte translations, (s_val, word_index): [LFSR applied 0, 1, 2, ... times]
+    __lfsr_powers = {}
+
+    def __init__(self, key, key_size, block_size, rounds):
+        """
+        Initialize a lazy key schedule.
+        :param key: Int representation of the tweakey
+        :param key_size: Int representing the tweakey in bits, a multiple of block_size
+        :param block_size: Int representing the block size in bits, 64 or 128
+        :param rounds: Int number of rounds the schedule covers, any number of rounds can be used
+                       for reduced round variants
+        :return: None
+        """
+        self.key = key
+        self.key_size = key_size
+        self.block_size = block_size
+        self.rounds = rounds
+        self.s_val = block_size >> 4
+        block_bytes = block_size >> 3
+
+        # Tweakey words split into cells, TK1 first
+        self.words = []
+        for word_num in range(key_size // block_size):
+            word = (key >> (key_size - block_size * (word_num + 1))) & ((1 << block_size) - 1)
+            word = word.to_bytes(block_bytes, 'big')
+            if self.s_val == 4:
+                cells = bytearray(16)
+                cells[0::2] = bytes(bytearray(x >> 4 for x in word))
+                cells[1::2] = bytes(bytearray(x & 0xF for x in word))
+                word = bytes(cells)
+            self.words.append(word)
+
+        self.cells = bytearray((rounds + 1) << 3)
+        self.computed = bytearray(rounds + 1)
+
+        # Round keys the cipher engines derive from this schedule, (engine, rounds): tuple, shared by every
+        # cipher the schedule is cached for
+        self.engine_keys = {}
+
+        if not self.permutation_powers:
+            permutation = SkinnyCipher.tweakey_permutation
+            positions = list(range(16))
+            powers = []
+            for x in range(16):
+                powers.append(itemgetter(*positions[:8]))
+                positions = [positions[y] for y in permutation]
+            SkinnyKeySchedule.permutation_powers = powers
+        self.lfsr_powers = [self.lfsr_power_table(word_index, (rounds + 1) >> 1)
+                            for word_index in range(len(self.words))]
+
+    def lfsr_cell(self, word_index, cell):
+        # LFSR applied to the top two rows of TK2 (word_index 1) and TK3 (word_index 2) every round
+        if self.s_val == 4:
+            if word_index == 1:
+                return ((cell << 1) ^ ((cell >> 3) ^ (cell >> 2) & 1)) & 0xF
+            return ((cell >> 1) ^ ((cell << 3) ^ cell & 0x8)) & 0xF
+        if word_index == 1:
+            return ((cell << 1) ^ ((cell >> 7) ^ (cell >> 5) & 1)) & 0xFF
+        return ((cell >> 1) ^ ((cell << 7) ^ (cell << 1) & 0x80)) & 0xFF
+
+    def lfsr_power_table(self, word_index, count):
+        # Translations for up to count LFSR steps, extended copies replace shared lists so readers never see them grow
+        powers = self.__lfsr_powers.get((self.s_val, word_index), [bytes(bytearray(range(256)))])
+        if len(powers) <= count:
+            powers = list(powers)
+            while len(powers) <= count:
+                powers.append(bytes(bytearray(self.lfsr_cell(word_index, x) if word_index else x
+                                              for x in powers[-1])))
+            self.__lfsr_powers[(self.s_val, word_index)] = powers
+        return powers
+
+    def round_key(self, round_num):
+        """
+        Cells of rows 0 and 1 of a round tweakey.
+        :param round_num: Int round from 0 up to rounds
+        :return: bytes of 8 cells
+        """
+        if not 0 <= round_num <= self.rounds:
+            raise IndexError('Round {} is outside of the {} round schedule'.format(round_num, self.rounds))
+        offset = round_num << 3
+        if not self.computed[round_num]:
+            gather = self.permutation_powers[round_num & 15]
+            steps = (round_num + 1) >> 1
+            round_key = 0
+            for word, powers in zip(self.words, self.lfsr_powers):
+                round_key ^= int.from_bytes(bytes(bytearray(gather(word))).translate(powers[steps]), 'big')
+            self.cells[offset:offset + 8] = round_key.to_bytes(8, 'big')
+            self.computed[round_num] = 1
+        return bytes(self.cells[offset:offset + 8])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[round_num] for round_num in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        round_key = self.round_key(index)
+        return [array('B', round_key[:4]), array('B', round_key[4:])]
+
+    def __len__(self):
+        return self.rounds + 1
+
+    def __iter__(self):
+        for round_num in range(len(self)):
+            yield self[round_num]
+
+    def __sizeof__(self):
+        engine_keys = list(self.engine_keys.values())
+        return object.__sizeof__(self) + sum(getsizeof(value) for value in [self.cells, self.computed] + self.words) + \
+            sum(getsizeof(round_keys) + sum(getsizeof(round_key) for round_key in round_keys)
+                for round_keys in engine_keys)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lfsr_powers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lfsr_powers = [self.lfsr_power_table(word_index, (self.rounds + 1) >> 1)
+                            for word_index in range(len(self.words))]
+
+
+class SkinnyModes:
+    """
+    Block cipher modes of operation shared by SkinnyCipher and SkinnyContext.
+    Subclasses provide the block functions and block geometry, the mode keeps its
+    chaining state in iv and counter.
+    """
+    __slots__ = ()
+
+    __valid_modes = ['ECB', 'CTR', 'CBC', 'PCBC', 'CFB', 'OFB']
+
+    def setup_mode(self, mode, init, counter):
+        # Parse the given iv and truncate it to the block length
+        try:
+            iv_int = init & self.block_mask 
+            self.iv = iv_int
+        except (ValueError, TypeError):
+            print('Invalid IV Value!')
+            print('Please Provide IV as int')
+            raise
+
+        # Parse the given Counter and truncate it to the block length
+        try:
+            self.counter = (iv_int + counter) & self.block_mask
+            self.initial_counter = self.counter
+        except (ValueError, TypeError):
+            print('Invalid Counter Value!')
+            print('Please Provide Counter as int')
+            raise
+
+        # Check Cipher Mode
+        try:
+            position = self.__valid_modes.index(mode)
+            self.mode = self.__valid_modes[position]
+        except ValueError:
+            print('Invalid cipher mode!')
+            print('Please use one of the following block cipher modes:', self.__valid_modes)
+            raise
+
+    def encrypt(self, plaintext, tweak=None):
+        
+        try:
+            pt_int = plaintext & self.block_mask
+        except (ValueError, TypeError):
+            print('Invalid Plaintext Value!')
+            print('Please Provide Plaintext as int')
+            raise
+
+        # Select the block function for the given tweak
+        encrypt_block = self.encrypt_block if tweak is None else self.tweak_encrypt_block(tweak)
+        
+        # Prepare Based On Mode
+        if self.mode == 'ECB':
+            ciphertext = encrypt_block(pt_int)
+            return ciphertext
+        
+        elif self.mode == 'CTR':
+            keystream = encrypt_block(self.counter)
+            self.counter = (self.counter + 1) & self.block_mask
+            ciphertext = pt_int ^ keystream
+            return ciphertext
+
+        elif self.mode == 'CBC':
+            ciphertext = encrypt_block(pt_int ^ self.iv)
+            self.iv = ciphertext
+            return ciphertext
+
+        elif self.mode == 'PCBC':
+            ciphertext = encrypt_block(pt_int ^ self.iv)
+            self.iv = pt_int ^ ciphertext
+            return ciphertext
+
+        elif self.mode == 'CFB':
+            ciphertext = pt_int ^ encrypt_block(self.iv)
+            self.iv = ciphertext
+            return ciphertext
+
+        elif self.mode == 'OFB':
+            self.iv = encrypt_block(self.iv)
+            ciphertext = pt_int ^ self.iv
+            return ciphertext
+
+    def decrypt(self, ciphertext, tweak=None):
+        
+        try:
+            ct_int = ciphertext & self.block_mask
+        except (ValueError, TypeError):
+            print('Invalid Ciphertext Value!')
+            print('Please Provide Ciphertext as int')
+            raise
+
+        # Select the block functions for the given tweak, only the direction the mode uses is built
+        encrypt_block = self.encrypt_block
+        decrypt_block = self.decrypt_block
+        if tweak is not None:
+            if self.mode in ('ECB', 'CBC', 'PCBC'):
+                decrypt_block = self.tweak_decrypt_block(tweak)
+            else:
+                encrypt_block = self.tweak_encrypt_block(tweak)
+
+        # Prepare Based On Mode
+        if self.mode == 'ECB':
+            plaintext = decrypt_block(ct_int)
+            return plaintext
+        
+        elif self.mode == 'CTR':
+            keystream = encrypt_block(self.counter)
+            self.counter = (self.counter + 1) & self.block_mask
+            plaintext = ct_int ^ keystream
+            return plaintext
+
+        elif self.mode == 'CBC':
+            plaintext = decrypt_block(ct_int) ^ self.iv
+            self.iv = ct_int
+            return plaintext
+
+        elif self.mode == 'PCBC':
+            plaintext = decrypt_block(ct_int) ^ self.iv
+            self.iv = plaintext ^ ct_int
+            return plaintext
+
+        elif self.mode == 'CFB':
+            plaintext = ct_int ^ encrypt_block(self.iv)
+            self.iv = ct_int
+            return plaintext
+
+        elif self.mode == 'OFB':
+            self.iv = encrypt_block(self.iv)
+            plaintext = ct_int ^ self.iv
+            return plaintext
+
+    def prepare_buffers(self, src, dst):
+        # Check a source/destination buffer pair, allocating the destination when none was given
+        block_bytes = self.block_size >> 3
+        with memoryview(src) as src_view:
+            length = src_view.nbytes
+        if length % block_bytes:
+            print('Invalid buffer length!')
+            print('Please Provide a buffer holding a whole number of', block_bytes, 'byte blocks')
+            raise ValueError('Buffer length is not a multiple of the block size')
+
+        if dst is None:
+            dst = bytearray(length)
+        with memoryview(dst) as dst_view:
+            if dst_view.readonly or dst_view.nbytes < length:
+                print('Invalid output buffer!')
+                print('Please Provide a writable buffer of at least', length, 'bytes')
+                raise ValueError('Output buffer is read-only or too small')
+        return dst, length
+
+    def process_buffer(self, src, dst, encrypting, tweak=None):
+        block_bytes = self.block_size >> 3
+        dst, length = self.prepare_buffers(src, dst)
+
+        # Independent blocks are handled a batch at a time, chained modes block by block
+        if self.mode in ('ECB', 'CTR'):
+            batch_bytes = self.bitslice_batch * block_bytes
+            for batch_offset in range(0, length, batch_bytes):
+                offsets = range(batch_offset, min(batch_offset + batch_bytes, length), block_bytes)
+                blocks = [self.unpack_block(src, offset) for offset in offsets]
+                if self.mode == 'CTR':
+                    keystream = self.encrypt_block_list([(self.counter + x) & self.block_mask
+                                                         for x in range(len(blocks))], tweak)
+                    self.counter = (self.counter + len(blocks)) & self.block_mask
+                    blocks = [block ^ key for block, key in zip(blocks, keystream)]
+                elif encrypting:
+                    blocks = self.encrypt_block_list(blocks, tweak)
+                else:
+                    blocks = self.decrypt_block_list(blocks, tweak)
+                for offset, block in zip(offsets, blocks):
+                    self.pack_block(dst, offset, block)
+        elif not encrypting and self.mode in ('CBC', 'CFB'):
+            self.decrypt_chained_buffer(src, dst, length, tweak)
+        else:
+            function = self.encrypt if encrypting else self.decrypt
+            for offset in range(0, length, block_bytes):
+                self.pack_block(dst, offset, function(self.unpack_block(src, offset), tweak))
+        return dst
+
+    def decrypt_chained_buffer(self, src, dst, length, tweak):
+        # Every CBC/CFB plaintext block depends only on two ciphertext blocks, so a whole batch goes through the
+        # block function at once and is then XORed with the ciphertext shifted by one block in a single big int XOR
+        block_bytes = self.block_size >> 3
+        batch_bytes = self.bitslice_batch * block_bytes
+        with memoryview(src) as src_view, src_view.cast('B') as src_bytes, \
+                memoryview(dst) as dst_view, dst_view.cast('B') as dst_bytes:
+            for batch_offset in range(0, length, batch_bytes):
+                end = min(batch_offset + batch_bytes, length)
+                blocks = [self.unpack_block(src_bytes, offset) for offset in range(batch_offset, end, block_bytes)]
+
+                # Chaining inputs are read before anything is written, so dst may be src
+                previous = self.iv.to_bytes(block_bytes, 'big') + src_bytes[batch_offset:end - block_bytes]
+                self.iv = blocks[-1]
+                if self.mode == 'CBC':
+                    processed = self.decrypt_block_list(blocks, tweak)
+                    chained = int.from_bytes(previous, 'big')
+                else:
+                    processed = self.encrypt_block_list([int.from_bytes(previous[x:x + block_bytes], 'big')
+                                                         for x in range(0, len(previous), block_bytes)], tweak)
+                    chained = int.from_bytes(src_bytes[batch_offset:end], 'big')
+
+                processed_bytes = bytearray(end - batch_offset)
+                for x, block in enumerate(processed):
+                    self.pack_block(processed_bytes, x * block_bytes, block)
+                dst_bytes[batch_offset:end] = (int.from_bytes(processed_bytes, 'big') ^ chained).to_bytes(
+                    end - batch_offset, 'big')
+
+    def encrypt_buffer(self, src, dst=None, tweak=None):
+        """
+        Encrypt every block of a bytes-like object in the configured cipher mode.
+        :param src: Buffer protocol object (bytes, bytearray, memoryview, mmap...) holding whole blocks
+        :param dst: Optional writable buffer for the ciphertext, may be the same object as src
+        :param tweak: Optional int tweak applied to every block, see SkinnyCipher tweak_words
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_buffer(src, dst, True, tweak)
+
+    def decrypt_buffer(self, src, dst=None, tweak=None):
+        """
+        Decrypt every block of a bytes-like object in the configured cipher mode.
+        :param src: Buffer protocol object (bytes, bytearray, memoryview, mmap...) holding whole blocks
+        :param dst: Optional writable buffer for the plaintext, may be the same object as src
+        :param tweak: Optional int tweak applied to every block, see SkinnyCipher tweak_words
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_buffer(src, dst, False, tweak)
+
+    def check_tweak_words(self):
+        if not self.tweak_bits:
+            print('No tweak words configured!')
+            print('Please initialize the cipher with tweak_words to supply a tweak per call')
+            raise ValueError('Cipher has no tweak words')
+
+    def check_sectors(self, length, first_sector, sector_size):
+        # Sectors must hold whole blocks, and every sector number and block index must fit its half of the tweak
+        self.check_tweak_words()
+        block_bytes = self.block_size >> 3
+        index_bits = self.tweak_bits >> 1
+        if not isinstance(sector_size, int) or sector_size <= 0 or sector_size % block_bytes or \
+                (sector_size // block_bytes) >> index_bits:
+            print('Invalid sector size!')
+            print('Please Provide a positive multiple of', block_bytes, 'bytes')
+            raise ValueError('Sector size must be a positive multiple of the block size')
+        if length % sector_size:
+            print('Invalid buffer length!')
+            print('Please Provide a buffer holding a whole number of', sector_size, 'byte sectors')
+            raise ValueError('Buffer length is not a multiple of the sector size')
+        try:
+            if first_sector < 0 or (first_sector + length // sector_size - 1) >> index_bits:
+                raise ValueError('Sector number out of range')
+        except (ValueError, TypeError):
+            print('Invalid sector number!')
+            print('Please Provide sector numbers as non-negative int below', 2 ** index_bits)
+            raise
+
+    def process_sectors(self, src, dst, first_sector, sector_size, encrypting):
+        block_bytes = self.block_size >> 3
+        dst, length = self.prepare_buffers(src, dst)
+        self.check_sectors(length, first_sector, sector_size)
+
+        # Every block is tweaked by its sector number and its index within the sector, so sectors are
+        # independent of each other and blocks are batched across sector boundaries
+        index_bits = self.tweak_bits >> 1
+        function = self.encrypt_tweaked_block_list if encrypting else self.decrypt_tweaked_block_list
+        batch_bytes = self.bitslice_batch * block_bytes
+        for batch_offset in range(0, length, batch_bytes):
+            offsets = range(batch_offset, min(batch_offset + batch_bytes, length), block_bytes)
+            blocks = [self.unpack_block(src, offset) for offset in offsets]
+            tweaks = [((first_sector + offset // sector_size) << index_bits) | ((offset % sector_size) // block_bytes)
+                      for offset in offsets]
+            for offset, block in zip(offsets, function(blocks, tweaks)):
+                self.pack_block(dst, offset, block)
+        return dst
+
+    def encrypt_sectors(self, src, first_sector, sector_size, dst=None):
+        """
+        Encrypt consecutive storage sectors, each one independently of its neighbours.
+        Block n of sector s is encrypted under the tweak (s << tweak_bits / 2) | n, the mode is not used.
+        :param src: Buffer protocol object holding whole sectors
+        :param first_sector: Int sector number of the first sector in src
+        :param sector_size: Int number of bytes per sector, a multiple of the block size
+        :param dst: Optional writable buffer for the ciphertext, may be the same object as src
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_sectors(src, dst, first_sector, sector_size, True)
+
+    def decrypt_sectors(self, src, first_sector, sector_size, dst=None):
+        """
+        Decrypt consecutive storage sectors, each one independently of its neighbours.
+        :param src: Buffer protocol object holding whole sectors
+        :param first_sector: Int sector number of the first sector in src
+        :param sector_size: Int number of bytes per sector, a multiple of the block size
+        :param dst: Optional writable buffer for the plaintext, may be the same object as src
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_sectors(src, dst, first_sector, sector_size, False)
+
+
+class SkinnyCipher(SkinnyModes):
 
     # Sbox Constants
     sbox4 = array('B', [12, 6, 9, 0, 1, 10, 2, 11, 3, 8, 5, 13, 4, 14, 7, 15])
@@ -62,8 +578,46 @@ class SkinnyCipher:
     __valid_setups = {64: {64: 32, 128: 36, 192: 40},
                       128: {128: 40, 256: 48, 384: 56}}
 
-    __valid_modes = ['ECB', 'CTR', 'CBC', 'PCBC', 'CFB', 'OFB']
-    
+    # Round engines available per instance:
+    # 'state' works cell by cell on flat cell buffers, 'table' works on a packed int
+    # using fused SubCells/ShiftRows/MixColumns lookup tables, 'unrolled' runs the table
+    # rounds as generated straight line code with the round keys of the key folded in,
+    # 'swar' (64 bit blocks only) runs every layer on all 16 nibbles of a packed int at once
+    __valid_engines = ['state', 'table', 'unrolled', 'swar']
+
+    # Struct formats of a block as big endian high/low words
+    __block_formats = {64: '>II', 128: '>QQ'}
+
+    # Fused round tables are independent of the key, so they are built once per block size:
+    # block_size: (encrypt_tables, decrypt_tables, inverse_sbox_translation)
+    __round_tables = {}
+
+    # Tweakey cell permutation, cell i of the next tweakey word is cell P[i] of the current one
+    tweakey_permutation = array('B', [9, 15, 8, 13, 10, 14, 12, 11, 0, 1, 2, 3, 4, 5, 6, 7])
+
+    # Per round tweak contributions only depend on the tweakey word they enter and the geometry:
+    # (block_size, rounds, word_num): (encrypt_nibble_tables, decrypt_nibble_tables)
+    __tweak_tables = {}
+
+    # Bitsliced form of the same contributions, per round the tweak bits XORed into each round tweakey bit:
+    # (block_size, rounds, word_num): [[(cell, bit, ((source_cell, source_bit), ...)), ...] per round]
+    __tweak_slices = {}
+
+    # Batched block processing switches to the bitsliced engine at this many blocks and
+    # hands at most this many blocks to it per call
+    bitslice_threshold = 32
+    bitslice_batch = 1024
+
+    # Expanded key schedules are shared process wide, set to None to expand every key from scratch
+    key_cache = KeyScheduleCache()
+
+    # Generated block functions of the unrolled engine are shared process wide in the same way
+    unrolled_cache = UnrolledCodeCache(max_entries=256)
+
+    # Byte translations splitting the two 4 bit cells of a byte into separate state cells
+    high_nibbles = bytes(bytearray(x >> 4 for x in range(256)))
+    low_nibbles = bytes(bytearray(x & 0xF for x in range(256)))
+
     def int_to_state(self, valid_int):
         byte_state = []
         for x in range(4):
@@ -84,7 +638,8 @@ class SkinnyCipher:
                 state_int += cell
         return state_int
 
-    def __init__(self, key, key_size=128, block_size=128, mode='ECB', init=0, counter=0):
+    def __init__(self, key, key_size=128, block_size=128, mode='ECB', init=0, counter=0, engine='state',
+                 tweak_words=(), rounds=None):
         """
         Initialize an instance of the Skinny block cipher.
         :param key: Int representation of the encryption key
@@ -93,6 +648,11 @@ class SkinnyCipher:
         :param mode: String representing which cipher block mode the object should initialize with
         :param init: IV for CTR, CBC, PCBC, CFB, and OFB modes
         :param counter: Initial Counter value for CTR mode
+        :param engine: String representing which round engine should compute the block function
+        :param tweak_words: Tuple of tweakey word numbers (1 for TK1 up to 3 for TK3) supplied as a tweak on
+                            every call instead of being part of the key, the first listed word is the most
+                            significant block of the tweak. Those words of key are ignored
+        :param rounds: Int number of rounds for a reduced round variant, None for the full number of rounds
         :return: None
         """
 
@@ -115,6 +675,14 @@ class SkinnyCipher:
             print('Please use one of the following key sizes:', [x for x in self.possible_setups.keys()])
             raise
 
+        # Reduced round variants run the first rounds of the full cipher
+        if rounds is not None:
+            if not isinstance(rounds, int) or not 0 < rounds <= self.rounds:
+                print('Invalid number of rounds!')
+                print('Please use a number of rounds from 1 up to', self.rounds)
+                raise ValueError('Invalid number of rounds')
+            self.rounds = rounds
+
         # Determine Cell Bit Size
         self.s_val = self.block_size >> 4
         
@@ -123,280 +691,1202 @@ class SkinnyCipher:
 
         self.row_size = self.s_val*4
         self.cell_size = (2**self.s_val - 1)
+        self.row_mask = ((2 ** self.row_size) - 1)
         self.block_mask = ((2 ** self.block_size) - 1)
+        self.word_mask = ((2 ** self.word_size) - 1)
+
+        # Blocks are read from and written to buffers as big endian high/low words
+        self.block_struct = Struct(self.__block_formats[self.block_size])
         
-        # Parse the given iv and truncate it to the block length
+        # Setup IV, counter and cipher mode
+        self.setup_mode(mode, init, counter)
+
+        # Check Tweak Words
         try:
-            iv_int = init & self.block_mask 
-            self.iv = self.int_to_state(iv_int)
+            self.tweak_words = tuple(tweak_words)
+            if any(word not in range(1, self.tweak_size + 1) for word in self.tweak_words) or \
+                    len(set(self.tweak_words)) != len(self.tweak_words):
+                raise ValueError('Invalid tweak words')
         except (ValueError, TypeError):
-            print('Invalid IV Value!')
-            print('Please Provide IV as int')
-            raise
+            print('Invalid tweak words!')
+            print('Please use distinct tweakey word numbers out of:', list(range(1, self.tweak_size + 1)))
+            raise ValueError('Tweak words must be distinct tweakey word numbers')
+        self.tweak_bits = self.block_size * len(self.tweak_words)
+        self.tweak_mask = (2 ** self.tweak_bits) - 1
 
-        # Parse the given Counter and truncate it to the block length
+        # Parse the given key and truncate it to the key length, tweak words are left zero
         try:
-            self.counter = (iv_int + counter) & self.block_mask
+            self.key = key & ((2 ** self.key_size) - 1)
+            for word_num in self.tweak_words:
+                self.key &= ~(self.block_mask << (self.key_size - self.block_size * word_num))
         except (ValueError, TypeError):
-            print('Invalid Counter Value!')
-            print('Please Provide Counter as int')
+            print('Invalid Key Value!')
+            print('Please Provide Key as int')
             raise
+        
+        # Reuse a cached key schedule, and the engine round keys kept with it, when this key was expanded before
+        key_id = (self.key, self.key_size, self.block_size)
+        self.key_schedule = self.key_cache.get(key_id) if self.key_cache is not None else None
+        cached = self.key_schedule is not None
+        if not cached:
+            self.key_schedule = self.expand_key()
 
-        # Check Cipher Mode
+        # Check Round Engine
         try:
-            position = self.__valid_modes.index(mode)
-            self.mode = self.__valid_modes[position]
+            position = self.__valid_engines.index(engine)
+            self.engine = self.__valid_engines[position]
         except ValueError:
-            print('Invalid cipher mode!')
-            print('Please use one of the following block cipher modes:', self.__valid_modes)
+            print('Invalid round engine!')
+            print('Please use one of the following round engines:', self.__valid_engines)
             raise
+        if self.engine == 'swar' and self.block_size != 64:
+            print('Invalid round engine for block size!')
+            print('The swar engine supports the following block sizes:', [64])
+            raise ValueError('SWAR engine requires 64 bit blocks')
+
+        self.setup_engine()
+
+        # New schedules are cached once the engine round keys are in them, so their size is accounted for
+        if not cached and self.key_cache is not None:
+            self.key_cache.put(key_id, self.key_schedule)
+
+    def setup_engine(self):
+        # Round keys and block functions of the selected engine, derived from the expanded key schedule.
+        # Rerunning it gives an instance sharing that schedule its own engine state
+
+        # Bitsliced and vectorized round keys are only built once bulk processing is requested
+        self.bitslice_round_keys = None
+        self.numpy_round_keys = None
+
+        # Scratch state buffers of the state engine, one pair per thread
+        self.state_buffers = local()
+
+        # Round keys of the last tweak seen per direction, keyed by encrypting
+        self.tweak_memo = {True: (None, None), False: (None, None)}
 
-        # Parse the given key and truncate it to the key length
+        # Bitsliced round tweakey bits per tuple of tweak word positions that vary within a batch
+        self.bitslice_tweak_keys = {}
+
+        # Tweaked blocks always run on the table engine, whose round keys are packed ints
+        if self.tweak_words:
+            self.setup_table_engine()
+            self.setup_tweak_tables()
+
+        # Bind the block functions of the selected engine
+        if self.engine == 'table':
+            self.setup_table_engine()
+            self.encrypt_block = self.table_encrypt
+            self.decrypt_block = self.table_decrypt
+        elif self.engine == 'unrolled':
+            self.setup_table_engine()
+            self.setup_unrolled_engine()
+        elif self.engine == 'swar':
+            self.swar_round_keys = self.engine_round_keys('swar', self.swar_engine_keys)
+            self.encrypt_block = self.swar_encrypt
+            self.decrypt_block = self.swar_decrypt
+        else:
+            self.setup_state_engine()
+            self.encrypt_block = self.state_encrypt
+            self.decrypt_block = self.state_decrypt
+
+    def __getstate__(self):
+        # Struct objects, thread local scratch buffers and generated functions cannot be pickled, they are rebuilt
+        state = self.__dict__.copy()
+        del state['block_struct']
+        del state['state_buffers']
+        if self.engine == 'unrolled':
+            del state['encrypt_block']
+            del state['decrypt_block']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.block_struct = Struct(self.__block_formats[self.block_size])
+        self.state_buffers = local()
+        if self.engine == 'unrolled':
+            self.setup_unrolled_engine()
+
+    def expand_key(self):
+        # Round tweakeys are only computed once an engine asks for them, always for the full number of rounds
+        # of the configuration so reduced round ciphers share cached schedules with full ones
+        return SkinnyKeySchedule(self.key, self.key_size, self.block_size, self.possible_setups[self.key_size])
+
+    lfsr_cell = SkinnyKeySchedule.lfsr_cell
+
+    def tweakey_word_schedule(self, word_index, value):
+        """
+        Run the key schedule of a single tweakey word.
+        :param word_index: Int position of the word in the tweakey, 0 for TK1 up to 2 for TK3
+        :param value: Int value of the word
+        :return: List of the packed per round contributions of the word to rows 0 and 1 of the state
+        """
+        cells = [(value >> (self.s_val * (15 - x))) & self.cell_size for x in range(16)]
+        contributions = []
+        for round_num in range(self.rounds):
+            round_key = 0
+            for cell in cells[:8]:
+                round_key = (round_key << self.s_val) | cell
+            contributions.append(round_key << (self.row_size * 2))
+            cells = [cells[x] for x in self.tweakey_permutation]
+            if word_index > 0:
+                cells[:8] = [self.lfsr_cell(word_index, cell) for cell in cells[:8]]
+        return contributions
+
+    def engine_round_keys(self, engine, build):
+        # Round keys of an engine are built once per key schedule and number of rounds, read only from then on
+        keys_id = (engine, self.rounds)
+        round_keys = self.key_schedule.engine_keys.get(keys_id)
+        if round_keys is None:
+            round_keys = build()
+            self.key_schedule.engine_keys[keys_id] = round_keys
+        return round_keys
+
+    def setup_state_engine(self):
+        self.state_round_keys = self.engine_round_keys('state', self.state_engine_keys)
+
+    def state_engine_keys(self):
+        # Round tweakey cells of rows 0 and 1 per round with the round constant folded in,
+        # the constant 0x2 of row 2 is added by the round functions
+        round_keys = []
+        for round_num in range(self.rounds):
+            round_key = bytearray(self.key_schedule.round_key(round_num))
+            round_key[0] ^= self.round_constants[round_num] & 0xF
+            round_key[4] ^= self.round_constants[round_num] >> 4
+            round_keys.append(bytes(round_key))
+        return tuple(round_keys)
+
+    def state_scratch(self):
+        # Two flat 16 cell buffers per thread, the rounds write from one into the other
         try:
-            self.key = key & ((2 ** self.key_size) - 1)
+            return self.state_buffers.scratch
+        except AttributeError:
+            self.state_buffers.scratch = (bytearray(16), bytearray(16))
+            return self.state_buffers.scratch
+
+    def load_state(self, block, state):
+        """
+        Write a block into a flat state buffer, cell (row, column) at index 4 * row + column.
+        :param block: Int block or bytes-like big endian block of block_size bits
+        :param state: bytearray of 16 cells
+        :return: None
+        """
+        if self.s_val == 8:
+            if isinstance(block, int):
+                self.block_struct.pack_into(state, 0, block >> 64, block & 0xFFFFFFFFFFFFFFFF)
+            else:
+                state[:] = block
+        else:
+            data = block.to_bytes(8, 'big') if isinstance(block, int) else bytes(block)
+            state[0::2] = data.translate(self.high_nibbles)
+            state[1::2] = data.translate(self.low_nibbles)
+
+    def store_state(self, state):
+        """
+        Read a block from a flat state buffer.
+        :param state: bytearray of 16 cells
+        :return: Int block
+        """
+        if self.s_val == 8:
+            return int.from_bytes(state, 'big')
+        # Every cell is a single hex digit behind a zero digit
+        return int(state.hex()[1::2], 16)
+
+    def state_encrypt(self, block):
+        state, scratch = self.state_scratch()
+        self.load_state(block, state)
+        return self.store_state(self.encrypt_function(state, scratch))
+
+    def state_decrypt(self, block):
+        state, scratch = self.state_scratch()
+        self.load_state(block, state)
+        return self.store_state(self.decrypt_function(state, scratch))
+
+    def encrypt_function(self, state, scratch):
+        # Every round reads one buffer and writes the other, column by column: with a, b, c and d the cells
+        # of rows 0 to 3 that ShiftRows moves into the column, after SubCells and AddRoundConstant/AddTweakKey,
+        # MixColumns outputs a^c^d, a, b^c and a^c
+        sbox = self.sbox4 if self.s_val == 4 else self.sbox8
+        s, t = state, scratch
+        for k in self.state_round_keys:
+            a = sbox[s[0]] ^ k[0]
+            c = sbox[s[10]]
+            t[0] = a ^ c ^ sbox[s[13]]
+            t[4] = a
+            t[8] = sbox[s[7]] ^ k[7] ^ c
+            t[12] = a ^ c
+
+            a = sbox[s[1]] ^ k[1]
+            c = sbox[s[11]]
+            t[1] = a ^ c ^ sbox[s[14]]
+            t[5] = a
+            t[9] = sbox[s[4]] ^ k[4] ^ c
+            t[13] = a ^ c
+
+            a = sbox[s[2]] ^ k[2]
+            c = sbox[s[8]] ^ 0x2
+            t[2] = a ^ c ^ sbox[s[15]]
+            t[6] = a
+            t[10] = sbox[s[5]] ^ k[5] ^ c
+            t[14] = a ^ c
+
+            a = sbox[s[3]] ^ k[3]
+            c = sbox[s[9]]
+            t[3] = a ^ c ^ sbox[s[12]]
+            t[7] = a
+            t[11] = sbox[s[6]] ^ k[6] ^ c
+            t[15] = a ^ c
+            s, t = t, s
+        return s
+
+    def decrypt_function(self, state, scratch):
+        # Inverse of a round column by column: a = row 1, c = row 3 ^ a, d = row 0 ^ row 3 and b = row 2 ^ c,
+        # which are moved back by the inverse ShiftRows, stripped of round constant and tweakey and inverse S-boxed
+        sbox_inv = self.sbox4_inv if self.s_val == 4 else self.sbox8_inv
+        s, t = state, scratch
+        for k in reversed(self.state_round_keys):
+            a = s[4]
+            c = s[12] ^ a
+            t[0] = sbox_inv[a ^ k[0]]
+            t[7] = sbox_inv[s[8] ^ c ^ k[7]]
+            t[10] = sbox_inv[c]
+            t[13] = sbox_inv[s[0] ^ s[12]]
+
+            a = s[5]
+            c = s[13] ^ a
+            t[1] = sbox_inv[a ^ k[1]]
+            t[4] = sbox_inv[s[9] ^ c ^ k[4]]
+            t[11] = sbox_inv[c]
+            t[14] = sbox_inv[s[1] ^ s[13]]
+
+            a = s[6]
+            c = s[14] ^ a
+            t[2] = sbox_inv[a ^ k[2]]
+            t[5] = sbox_inv[s[10] ^ c ^ k[5]]
+            t[8] = sbox_inv[c ^ 0x2]
+            t[15] = sbox_inv[s[2] ^ s[14]]
+
+            a = s[7]
+            c = s[15] ^ a
+            t[3] = sbox_inv[a ^ k[3]]
+            t[6] = sbox_inv[s[11] ^ c ^ k[6]]
+            t[9] = sbox_inv[c]
+            t[12] = sbox_inv[s[3] ^ s[15]]
+            s, t = t, s
+        return s
+
+    def shift_mix(self, value):
+        # ShiftRows followed by MixColumns on a packed state
+        rows = []
+        for x in range(4):
+            row = (value >> (self.row_size * (3 - x))) & self.row_mask
+            shift = self.s_val * x
+            rows.append(((row >> shift) | (row << (self.row_size - shift))) & self.row_mask)
+        mix_1 = rows[1] ^ rows[2]
+        mix_2 = rows[0] ^ rows[2]
+        mix_3 = rows[3] ^ mix_2
+        return (((((mix_3 << self.row_size) | rows[0]) << self.row_size) | mix_1) << self.row_size) | mix_2
+
+    def inv_shift_mix(self, value):
+        # Inverse MixColumns followed by Inverse ShiftRows on a packed state
+        rows = [(value >> (self.row_size * (3 - x))) & self.row_mask for x in range(4)]
+        mix_1 = rows[0] ^ rows[3]
+        mix_2 = rows[1] ^ rows[3]
+        mix_3 = rows[2] ^ mix_2
+        rows = [rows[1], mix_3, mix_2, mix_1]
+        state_int = 0
+        for x, row in enumerate(rows):
+            shift = self.s_val * x
+            state_int <<= self.row_size
+            state_int |= ((row << shift) | (row >> (self.row_size - shift))) & self.row_mask
+        return state_int
+
+    def sub_cells_byte(self, byte_val, sbox):
+        # Apply an S-box to every cell packed into a single byte
+        if self.s_val == 4:
+            return (sbox[byte_val >> 4] << 4) | sbox[byte_val & 0xF]
+        return sbox[byte_val]
+
+    def pack_round_tweakey(self, round_num):
+        # Packed round constant and round tweakey as added to the state after SubCells
+        round_constant = self.round_constants[round_num]
+        round_key_rows = [array('B', self.key_schedule[round_num][0]),
+                          array('B', self.key_schedule[round_num][1]),
+                          array('B', [0x2, 0, 0, 0]),
+                          array('B', [0, 0, 0, 0])]
+        round_key_rows[0][0] ^= round_constant & 0xF
+        round_key_rows[1][0] ^= round_constant >> 4
+        return self.state_to_int(round_key_rows)
+
+    def setup_table_engine(self):
+        # Build the fused round tables for this block size on first use
+        if self.block_size not in self.__round_tables:
+            state_bytes = self.block_size >> 3
+            sbox, sbox_inv = (self.sbox4, self.sbox4_inv) if self.s_val == 4 else (self.sbox8, self.sbox8_inv)
+            encrypt_tables = []
+            decrypt_tables = []
+            for position in range(state_bytes):
+                shift = (state_bytes - 1 - position) << 3
+                encrypt_tables.append(tuple(self.shift_mix(self.sub_cells_byte(v, sbox) << shift)
+                                            for v in range(256)))
+                decrypt_tables.append(tuple(self.inv_shift_mix(self.sub_cells_byte(v, sbox_inv) << shift)
+                                            for v in range(256)))
+            inverse_sbox_translation = bytes(bytearray(self.sub_cells_byte(v, sbox_inv) for v in range(256)))
+            self.__round_tables[self.block_size] = (encrypt_tables, decrypt_tables, inverse_sbox_translation)
+
+        self.encrypt_tables, self.decrypt_tables, self.inverse_sbox_translation = \
+            self.__round_tables[self.block_size]
+
+        self.table_decrypt_keys, self.table_encrypt_keys = self.engine_round_keys('table', self.table_engine_keys)
+
+    def table_engine_keys(self):
+        # Round tweakeys are folded through ShiftRows/MixColumns for the fused encryption round,
+        # decryption adds them before the fused inverse S-box/mixing round
+        decrypt_keys = tuple(self.pack_round_tweakey(round_num) for round_num in range(self.rounds))
+        return decrypt_keys, tuple(self.shift_mix(round_key) for round_key in decrypt_keys)
+
+    def swar_engine_keys(self):
+        # Packed round tweakeys, with the complement of rows 2 and 3 the complemented rounds need
+        return tuple(self.pack_round_tweakey(round_num) ^ 0xFFFFFFFF for round_num in range(self.rounds))
+
+    def table_encrypt(self, block, round_keys=None):
+        state_bytes = self.block_size >> 3
+        tables = self.encrypt_tables
+        if round_keys is None:
+            round_keys = self.table_encrypt_keys
+        for round_key in round_keys:
+            cells = block.to_bytes(state_bytes, 'big')
+            block = round_key
+            for table, cell in zip(tables, cells):
+                block ^= table[cell]
+        return block
+
+    def table_decrypt(self, block, round_keys=None):
+        state_bytes = self.block_size >> 3
+        tables = self.decrypt_tables
+        if round_keys is None:
+            round_keys = self.table_decrypt_keys
+        block = self.inv_shift_mix(block)
+        for round_key in round_keys[:0:-1]:
+            cells = (block ^ round_key).to_bytes(state_bytes, 'big')
+            block = 0
+            for table, cell in zip(tables, cells):
+                block ^= table[cell]
+
+        # Final round has no mixing layer left to undo
+        cells = (block ^ round_keys[0]).to_bytes(state_bytes, 'big')
+        return int.from_bytes(cells.translate(self.inverse_sbox_translation), 'big')
+
+    def unrolled_source(self):
+        """
+        Generate the source of the unrolled engine for the current key.
+        :return: String defining build_block_functions(tables..., inverse_tables..., inv_shift_mix, translation),
+                 which returns the (encrypt_block, decrypt_block) pair
+        """
+        state_bytes = self.block_size >> 3
+        cells = ', '.join('c{}'.format(x) for x in range(state_bytes)) + ','
+        encrypt_terms = ' ^ '.join('e{0}[c{0}]'.format(x) for x in range(state_bytes))
+        decrypt_terms = ' ^ '.join('d{0}[c{0}]'.format(x) for x in range(state_bytes))
+
+        lines = ['def build_block_functions({}, {}, inv_shift_mix, translation):'.format(
+                     ', '.join('e{}'.format(x) for x in range(state_bytes)),
+                     ', '.join('d{}'.format(x) for x in range(state_bytes))),
+                 '    def encrypt_block(block):']
+        for round_key in self.table_encrypt_keys:
+            lines.append('        {} = block.to_bytes({}, \'big\')'.format(cells, state_bytes))
+            lines.append('        block = {:#x} ^ {}'.format(round_key, encrypt_terms))
+        lines.append('        return block')
+
+        lines.append('    def decrypt_block(block):')
+        lines.append('        block = inv_shift_mix(block)')
+        for round_key in self.table_decrypt_keys[:0:-1]:
+            lines.append('        {} = (block ^ {:#x}).to_bytes({}, \'big\')'.format(cells, round_key, state_bytes))
+            lines.append('        block = {}'.format(decrypt_terms))
+        lines.append('        return int.from_bytes((block ^ {:#x}).to_bytes({}, \'big\').translate(translation), '
+                     '\'big\')'.format(self.table_decrypt_keys[0], state_bytes))
+        lines.append('    return encrypt_block, decrypt_block')
+        return '\n'.join(lines) + '\n'
+
+    def setup_unrolled_engine(self):
+        # Functions are generated once per key and block size, the fused tables are shared by all of them
+        key_id = (self.key, self.key_size, self.block_size, self.rounds)
+        functions = self.unrolled_cache.get(key_id) if self.unrolled_cache is not None else None
+        if functions is None:
+            namespace = {}
+            exec(compile(self.unrolled_source(), '<skinny-{}-{}>'.format(self.block_size, self.key_size), 'exec'),
+                 namespace)
+            functions = namespace['build_block_functions'](*(self.encrypt_tables + self.decrypt_tables +
+                                                             [self.inv_shift_mix, self.inverse_sbox_translation]))
+            if self.unrolled_cache is not None:
+                self.unrolled_cache.put(key_id, functions)
+        self.encrypt_block, self.decrypt_block = functions
+
+    def swar_encrypt(self, block):
+        # Rows are 16 bit lanes of the packed state, row 0 in the top lane and cell 0 in the top nibble of its row.
+        # The state is kept complemented, which turns every NOR of the S-box into an AND, the complement picked up
+        # by rows 2 and 3 in MixColumns is folded into the round keys
+        block ^= 0xFFFFFFFFFFFFFFFF
+        for round_key in self.swar_round_keys:
+            # SubCells, the NOR/XOR network of the 4-bit S-box on bit j of every nibble at once,
+            # followed by the bit rotation of every nibble, then AddRoundConstant and AddTweakKey
+            block ^= (block >> 3) & (block >> 2) & 0x1111111111111111
+            block ^= (block << 1) & (block << 2) & 0x8888888888888888
+            block ^= (block << 1) & (block << 2) & 0x4444444444444444
+            block ^= (block >> 2) & (block << 1) & 0x2222222222222222
+            block = ((block >> 1) & 0x7777777777777777 | (block << 3) & 0x8888888888888888) ^ round_key
+
+            # ShiftRows, rows 1 to 3 rotate right by 1 to 3 cells within their lanes
+            row_0 = block >> 48
+            row_1 = (block >> 32) & 0xFFFF
+            row_1 = row_1 >> 4 | (row_1 & 0xF) << 12
+            row_2 = (block >> 24) & 0xFF | (block >> 8) & 0xFF00
+            row_3 = (block >> 12) & 0xF | (block << 4) & 0xFFF0
+
+            # MixColumns
+            mix = row_0 ^ row_2
+            block = (mix ^ row_3) << 48 | row_0 << 32 | (row_1 ^ row_2) << 16 | mix
+        return block ^ 0xFFFFFFFFFFFFFFFF
+
+    def swar_decrypt(self, block):
+        block ^= 0xFFFFFFFFFFFFFFFF
+        for round_key in reversed(self.swar_round_keys):
+            # Inverse MixColumns
+            row_0 = (block >> 32) & 0xFFFF
+            row_3 = block & 0xFFFF
+            row_2 = row_3 ^ row_0
+            row_1 = ((block >> 16) & 0xFFFF) ^ row_2
+            row_3 ^= block >> 48
+
+            # Inverse ShiftRows, then inverse AddRoundConstant and AddTweakKey
+            block = (row_0 << 48 | ((row_1 << 4) & 0xFFF0 | row_1 >> 12) << 32 |
+                     ((row_2 << 8) & 0xFF00 | row_2 >> 8) << 16 | row_3 >> 4 | (row_3 & 0xF) << 12) ^ round_key
+
+            # Inverse SubCells, the nibble rotation undone and the network run backwards
+            block = (block << 1) & 0xEEEEEEEEEEEEEEEE | (block >> 3) & 0x1111111111111111
+            block ^= (block >> 2) & (block << 1) & 0x2222222222222222
+            block ^= (block << 1) & (block << 2) & 0x4444444444444444
+            block ^= (block << 1) & (block << 2) & 0x8888888888888888
+            block ^= (block >> 3) & (block >> 2) & 0x1111111111111111
+        return block ^ 0xFFFFFFFFFFFFFFFF
+
+    def join_round_keys(self, round_keys):
+        # Concatenate packed round keys into one int, round 0 in the least significant block
+        joined = 0
+        for round_key in reversed(round_keys):
+            joined = (joined << self.block_size) | round_key
+        return joined
+
+    def build_tweak_tables(self, word_index):
+        # The tweakey schedule is linear, so the contribution of any word value is the XOR of the
+        # contributions of its bits. Bits are combined four at a time into 16 entry nibble tables
+        encrypt_basis = []
+        decrypt_basis = []
+        for bit in range(self.block_size - 1, -1, -1):
+            contributions = self.tweakey_word_schedule(word_index, 1 << bit)
+            encrypt_basis.append(self.join_round_keys([self.shift_mix(round_key) for round_key in contributions]))
+            decrypt_basis.append(self.join_round_keys(contributions))
+
+        tables = []
+        for basis in (encrypt_basis, decrypt_basis):
+            nibble_tables = []
+            for position in range(0, self.block_size, 4):
+                table = [0]
+                for bit_contribution in reversed(basis[position:position + 4]):
+                    table += [entry ^ bit_contribution for entry in table]
+                nibble_tables.append(tuple(table))
+            tables.append(nibble_tables)
+        return tuple(tables)
+
+    def setup_tweak_tables(self):
+        # Nibble tables of every tweak word in tweak order, built once per geometry and tweakey word
+        self.tweak_encrypt_tables = []
+        self.tweak_decrypt_tables = []
+        for word_num in self.tweak_words:
+            table_id = (self.block_size, self.rounds, word_num)
+            if table_id not in self.__tweak_tables:
+                self.__tweak_tables[table_id] = self.build_tweak_tables(word_num - 1)
+            encrypt_tables, decrypt_tables = self.__tweak_tables[table_id]
+            self.tweak_encrypt_tables.extend(encrypt_tables)
+            self.tweak_decrypt_tables.extend(decrypt_tables)
+
+    def tweak_round_keys(self, tweak, encrypting):
+        """
+        Table engine round keys for a tweak, the key only schedule with the tweak contribution XORed in.
+        :param tweak: Int tweak holding the configured tweak words
+        :param encrypting: Bool, True for table_encrypt round keys and False for table_decrypt round keys
+        :return: List of packed int round keys
+        """
+        memo_tweak, round_keys = self.tweak_memo[encrypting]
+        if round_keys is not None and memo_tweak == tweak:
+            return round_keys
+        self.check_tweak_words()
+
+        try:
+            digits = format(tweak & self.tweak_mask, '0{}x'.format(self.tweak_bits >> 2))
         except (ValueError, TypeError):
-            print('Invalid Key Value!')
-            print('Please Provide Key as int')
+            print('Invalid Tweak Value!')
+            print('Please Provide Tweak as int')
             raise
-        
-        # Initialize key state from input key value
-        key_state = []
-        for z in range(self.tweak_size):
-            sub_key = self.key >> ((self.key_size - self.block_size) - (z * self.block_size))
-            tweakkey = self.int_to_state(sub_key)
-            key_state.append(tweakkey)
-        
-        # Pre-compile key schedule
-        # Generate first round key from base input key
-        round_key_xor = [key_state[0][0], key_state[0][1]]
-        for twky in range(1, self.tweak_size):
-            round_key_xor[0] = array('B', map(xor, round_key_xor[0], key_state[twky][0]))
-            round_key_xor[1] = array('B', map(xor, round_key_xor[1], key_state[twky][1]))
-
-        self.key_schedule = [round_key_xor]
-        
-        # Generate remaining round keys
-        for x in range(self.rounds):
-            round_key_xor = [array('B', [0, 0, 0, 0]), array('B', [0, 0, 0, 0])]
-            for y, twky in enumerate(key_state):
-
-                # Perform Permutation Step
-                modifed_key_rows = [array('B', [twky[2][1], twky[3][3], twky[2][0], twky[3][1]]),
-                                    array('B', [twky[2][2], twky[3][2], twky[3][0], twky[2][3]])]
-                
-                if y > 0:  # Perform LFSR step on higher tweakey components
-                    lfsr_rows = []
-                    for mod_row in modifed_key_rows:
-                        lfsr_row = array('B', [])
-                        for cell in mod_row:
-                            if self.s_val == 4:
-                                if y == 1:
-                                    lfsr_row.append(((cell << 1) ^ ((cell >> 3) ^ (cell >> 2) & 1)) & 0xF)
-                                else:
-                                    lfsr_row.append(((cell >> 1) ^ ((cell << 3) ^ cell & 0x8)) & 0xF)
-                            else:
-                                if y == 1:
-                                    lfsr_row.append(((cell << 1) ^ ((cell >> 7) ^ (cell >> 5) & 1)) & 0xFF)
-                                else:
-                                    lfsr_row.append(((cell >> 1) ^ ((cell << 7) ^ (cell << 1) & 0x80)) & 0xFF)
-                
-                        lfsr_rows.append(lfsr_row)
-                    modifed_key_rows = lfsr_rows
-                
-                # Store updated round key data
-                round_key_xor[0] = array('B', map(xor, round_key_xor[0], modifed_key_rows[0]))
-                round_key_xor[1] = array('B', map(xor, round_key_xor[1], modifed_key_rows[1]))
-
-                # Update key state 
-                key_state[y] = [modifed_key_rows[0],
-                                modifed_key_rows[1],
-                                twky[0],
-                                twky[1]]
-
-            self.key_schedule.append([round_key_xor[0], round_key_xor[1]])
-
-    def encrypt(self, plaintext):
-        
+
+        if encrypting:
+            tables, key_only = self.tweak_encrypt_tables, self.table_encrypt_keys
+        else:
+            tables, key_only = self.tweak_decrypt_tables, self.table_decrypt_keys
+        contribution = 0
+        for table, digit in zip(tables, digits):
+            contribution ^= table[int(digit, 16)]
+        round_keys = [round_key ^ ((contribution >> (self.block_size * round_num)) & self.block_mask)
+                      for round_num, round_key in enumerate(key_only)]
+        self.tweak_memo[encrypting] = (tweak, round_keys)
+        return round_keys
+
+    def tweak_encrypt_block(self, tweak):
+        """
+        Block encryption function under a tweak.
+        :param tweak: Int tweak holding the configured tweak words
+        :return: Function mapping an int plaintext block to an int ciphertext block
+        """
+        return partial(self.table_encrypt, round_keys=self.tweak_round_keys(tweak, True))
+
+    def tweak_decrypt_block(self, tweak):
+        """
+        Block decryption function under a tweak.
+        :param tweak: Int tweak holding the configured tweak words
+        :return: Function mapping an int ciphertext block to an int plaintext block
+        """
+        return partial(self.table_decrypt, round_keys=self.tweak_round_keys(tweak, False))
+
+    def sbox4_bitsliced(self, bits, ones):
+        # NOR/XOR network of the 4-bit S-box applied to bit slices [x0, x1, x2, x3]
+        x0, x1, x2, x3 = bits
+        x0 ^= ~(x3 | x2) & ones
+        x3 ^= ~(x2 | x1) & ones
+        x2 ^= ~(x1 | x0) & ones
+        x1 ^= ~(x3 | x0) & ones
+        return [x1, x2, x3, x0]
+
+    def sbox4_inv_bitsliced(self, bits, ones):
+        x1, x2, x3, x0 = bits
+        x1 ^= ~(x3 | x0) & ones
+        x2 ^= ~(x1 | x0) & ones
+        x3 ^= ~(x2 | x1) & ones
+        x0 ^= ~(x3 | x2) & ones
+        return [x0, x1, x2, x3]
+
+    def sbox8_bitsliced(self, bits, ones):
+        # NOR/XOR network of the 8-bit S-box applied to bit slices [x0, ..., x7]
+        x0, x1, x2, x3, x4, x5, x6, x7 = bits
+        x0 ^= ~(x2 | x3) & ones
+        x4 ^= ~(x6 | x7) & ones
+        x5 ^= ~(x0 | x4) & ones
+        x6 ^= ~(x1 | x2) & ones
+        x1 ^= ~(x3 | x0) & ones
+        x7 ^= ~(x5 | x6) & ones
+        x3 ^= ~(x4 | x5) & ones
+        x2 ^= ~(x7 | x1) & ones
+        return [x2, x7, x6, x1, x3, x0, x4, x5]
+
+    def sbox8_inv_bitsliced(self, bits, ones):
+        x2, x7, x6, x1, x3, x0, x4, x5 = bits
+        x2 ^= ~(x7 | x1) & ones
+        x3 ^= ~(x4 | x5) & ones
+        x7 ^= ~(x5 | x6) & ones
+        x1 ^= ~(x3 | x0) & ones
+        x6 ^= ~(x1 | x2) & ones
+        x5 ^= ~(x0 | x4) & ones
+        x4 ^= ~(x6 | x7) & ones
+        x0 ^= ~(x2 | x3) & ones
+        return [x0, x1, x2, x3, x4, x5, x6, x7]
+
+    def bitslice_flips(self, packed_round_keys):
+        # Round constants and round tweakeys are the same for every block, so each round
+        # reduces to inverting a fixed set of (cell, bit) slices
+        round_keys = []
+        for round_key in packed_round_keys:
+            flips = []
+            for cell in range(16):
+                cell_value = (round_key >> (self.s_val * (15 - cell))) & self.cell_size
+                flips.extend((cell, bit) for bit in range(self.s_val) if (cell_value >> bit) & 1)
+            round_keys.append(flips)
+        return round_keys
+
+    def setup_bitslice_engine(self):
+        self.bitslice_round_keys = self.bitslice_flips([self.pack_round_tweakey(round_num)
+                                                        for round_num in range(self.rounds)])
+
+    def build_tweak_slices(self, word_index):
+        # Each round tweakey bit is the XOR of a fixed set of bits of the tweakey word
+        rounds = [{} for round_num in range(self.rounds)]
+        for bit in range(self.block_size):
+            source = (15 - bit // self.s_val, bit % self.s_val)
+            for round_num, round_key in enumerate(self.tweakey_word_schedule(word_index, 1 << bit)):
+                for cell in range(8):
+                    cell_value = (round_key >> (self.s_val * (15 - cell))) & self.cell_size
+                    for cell_bit in range(self.s_val):
+                        if (cell_value >> cell_bit) & 1:
+                            rounds[round_num].setdefault((cell, cell_bit), []).append(source)
+        return [[(cell, cell_bit, tuple(sources)) for (cell, cell_bit), sources in sorted(round_bits.items())]
+                for round_bits in rounds]
+
+    def setup_bitslice_tweaks(self, positions):
+        # Round tweakey bits of the tweak words at the given positions, sources indexed as (word position, cell, bit)
+        round_keys = [[] for round_num in range(self.rounds)]
+        for position in positions:
+            table_id = (self.block_size, self.rounds, self.tweak_words[position])
+            if table_id not in self.__tweak_slices:
+                self.__tweak_slices[table_id] = self.build_tweak_slices(self.tweak_words[position] - 1)
+            for round_key, round_bits in zip(round_keys, self.__tweak_slices[table_id]):
+                round_key.extend((cell, bit, tuple((position,) + source for source in sources))
+                                 for cell, bit, sources in round_bits)
+        self.bitslice_tweak_keys[positions] = round_keys
+
+    def bitslice_tweaks(self, tweaks):
+        """
+        Split a batch of tweaks into bitsliced round key material.
+        Tweak words shared by the whole batch are folded into the round keys, only varying words are transposed.
+        :param tweaks: List of int tweaks holding the configured tweak words
+        :return: Tuple of the round key flips, the per round tweakey bits of the varying words and the
+                 bitsliced varying words (None for shared words)
+        """
+        word_count = len(self.tweak_words)
+        shifts = [self.block_size * (word_count - 1 - position) for position in range(word_count)]
         try:
-            pt_int = plaintext & self.block_mask
-            plaintext_state = self.int_to_state(pt_int)
+            words = [[(tweak >> shift) & self.block_mask for tweak in tweaks] for shift in shifts]
         except (ValueError, TypeError):
-            print('Invalid Plaintext Value!')
-            print('Please Provide Plaintext as int')
+            print('Invalid Tweak Value!')
+            print('Please Provide Tweak as int')
             raise
-        
-        # Prepare Based On Mode
-        if self.mode == 'ECB':
-            internal_state = plaintext_state
-            internal_state = self.encrypt_function(internal_state)
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
-        
-        elif self.mode == 'CTR':
-            internal_state = self.int_to_state(self.counter)
-            self.counter += 1
-            internal_state = self.encrypt_function(internal_state)
-            internal_state = [array('B', map(xor, plaintext_state[x], internal_state[x])) for x in range(4)]
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
 
-        elif self.mode == 'CBC':
-            internal_state = [array('B', map(xor, plaintext_state[x], self.iv[x])) for x in range(4)]
-            internal_state = self.encrypt_function(internal_state)
-            self.iv = internal_state
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
+        shared = 0
+        positions = []
+        for position, (shift, values) in enumerate(zip(shifts, words)):
+            if values.count(values[0]) == len(values):
+                shared |= values[0] << shift
+            else:
+                positions.append(position)
+        positions = tuple(positions)
+        if positions not in self.bitslice_tweak_keys:
+            self.setup_bitslice_tweaks(positions)
 
-        elif self.mode == 'PCBC':
-            internal_state = [array('B', map(xor, plaintext_state[x], self.iv[x])) for x in range(4)]
-            internal_state = self.encrypt_function(internal_state)
-            self.iv = [array('B', map(xor, plaintext_state[x], internal_state[x])) for x in range(4)]
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
+        tweak_state = [self.bitslice_blocks(values) if position in positions else None
+                       for position, values in enumerate(words)]
+        return self.bitslice_flips(self.tweak_round_keys(shared, False)), self.bitslice_tweak_keys[positions], \
+            tweak_state
 
-        elif self.mode == 'CFB':
-            internal_state = self.encrypt_function(self.iv)
-            internal_state = [array('B', map(xor, plaintext_state[x], internal_state[x])) for x in range(4)]
-            self.iv = internal_state
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
+    def bitslice_blocks(self, blocks):
+        """
+        Transpose a list of int blocks into bitsliced form.
+        :param blocks: List of int blocks
+        :return: List of 16 cells, each a list of bit slices (least significant bit first) holding
+                 bit n of every block at bit position n of the slice
+        """
+        block_format = '0{}b'.format(self.block_size)
+        columns = zip(*[format(block & self.block_mask, block_format) for block in blocks])
+        bit_slices = [int(''.join(column[::-1]), 2) for column in columns]
+        return [[bit_slices[cell * self.s_val + (self.s_val - 1 - bit)] for bit in range(self.s_val)]
+                for cell in range(16)]
 
-        elif self.mode == 'OFB':
-            internal_state = self.encrypt_function(self.iv)
-            self.iv = internal_state
-            internal_state = [array('B', map(xor, plaintext_state[x], internal_state[x])) for x in range(4)]
-            ciphertext = self.state_to_int(internal_state)
-            return ciphertext
+    def unbitslice_blocks(self, state, block_count):
+        """
+        Transpose a bitsliced state back into a list of int blocks.
+        :param state: List of 16 cells of bit slices as produced by bitslice_blocks
+        :param block_count: Number of blocks packed into each bit slice
+        :return: List of int blocks
+        """
+        slice_format = '0{}b'.format(block_count)
+        columns = [format(cell[bit], slice_format)[::-1] for cell in state for bit in range(self.s_val - 1, -1, -1)]
+        return [int(''.join(block_bits), 2) for block_bits in zip(*columns)]
 
-    def encrypt_function(self, internal_state):    
-        
-        # Run Encryption Steps For Appropriate Number of Rounds
-        for round_num in range(self.rounds): 
+    def bitsliced_encrypt_function(self, state, ones, round_keys, tweak_keys=None, tweak_state=None):
+        sbox = self.sbox4_bitsliced if self.s_val == 4 else self.sbox8_bitsliced
+        for round_num in range(self.rounds):
             # S-box Layer
-            if self.s_val == 4:
-                sbox_state = [array('B', [self.sbox4[state_nib] for state_nib in state_row]) for state_row in internal_state]
-            else:
-                sbox_state = [array('B', [self.sbox8[state_byte] for state_byte in state_row]) for state_row in internal_state]
-            
-            internal_state = sbox_state
-
-            # AddRoundConstant
-            round_constant = self.round_constants[round_num]
-            c0 = round_constant & 0xF
-            c1 = round_constant >> 4
-            c2 = 0x2
-            internal_state[0][0] ^= c0
-            internal_state[1][0] ^= c1    
-            internal_state[2][0] ^= c2
-            
-            # AddTweakKey
-            internal_state[0] = array('B', map(xor, internal_state[0], self.key_schedule[round_num][0]))
-            internal_state[1] = array('B', map(xor, internal_state[1], self.key_schedule[round_num][1]))
+            state = [sbox(cell, ones) for cell in state]
+
+            # AddRoundConstant and AddTweakKey
+            for cell, bit in round_keys[round_num]:
+                state[cell][bit] ^= ones
+            if tweak_keys is not None:
+                for cell, bit, sources in tweak_keys[round_num]:
+                    for word, source_cell, source_bit in sources:
+                        state[cell][bit] ^= tweak_state[word][source_cell][source_bit]
 
             # Shift Rows
-            internal_state = [internal_state[0],
-                              array('B', [internal_state[1][3], internal_state[1][0], internal_state[1][1], internal_state[1][2]]),
-                              array('B', [internal_state[2][2], internal_state[2][3], internal_state[2][0], internal_state[2][1]]),
-                              array('B', [internal_state[3][1], internal_state[3][2], internal_state[3][3], internal_state[3][0]])]
+            state = [state[0], state[1], state[2], state[3],
+                     state[7], state[4], state[5], state[6],
+                     state[10], state[11], state[8], state[9],
+                     state[13], state[14], state[15], state[12]]
 
             # MixColumns
-            mix_1 = array('B', map(xor, internal_state[1], internal_state[2]))
-            mix_2 = array('B', map(xor, internal_state[0], internal_state[2]))
-            mix_3 = array('B', map(xor, internal_state[3], mix_2))
+            mix_1 = [[a ^ b for a, b in zip(state[4 + x], state[8 + x])] for x in range(4)]
+            mix_2 = [[a ^ b for a, b in zip(state[x], state[8 + x])] for x in range(4)]
+            mix_3 = [[a ^ b for a, b in zip(state[12 + x], mix_2[x])] for x in range(4)]
+            state = mix_3 + state[0:4] + mix_1 + mix_2
+        return state
 
-            internal_state = [mix_3, internal_state[0], mix_1, mix_2]
-        return internal_state                
+    def bitsliced_decrypt_function(self, state, ones, round_keys, tweak_keys=None, tweak_state=None):
+        sbox_inv = self.sbox4_inv_bitsliced if self.s_val == 4 else self.sbox8_inv_bitsliced
+        for round_num in range(self.rounds - 1, -1, -1):
+            # Inverse Mix Columns
+            mix_1 = [[a ^ b for a, b in zip(state[x], state[12 + x])] for x in range(4)]
+            mix_2 = [[a ^ b for a, b in zip(state[4 + x], state[12 + x])] for x in range(4)]
+            mix_3 = [[a ^ b for a, b in zip(state[8 + x], mix_2[x])] for x in range(4)]
+            state = state[4:8] + mix_3 + mix_2 + mix_1
 
-    def decrypt(self, ciphertext):
-        
-        try:
-            ct_int = ciphertext & self.block_mask
-            ciphertext_state = self.int_to_state(ct_int)
-        except (ValueError, TypeError):
-            print('Invalid Ciphertext Value!')
-            print('Please Provide Ciphertext as int')
-            raise
+            # Inverse Shift Rows
+            state = [state[0], state[1], state[2], state[3],
+                     state[5], state[6], state[7], state[4],
+                     state[10], state[11], state[8], state[9],
+                     state[15], state[12], state[13], state[14]]
+
+            # Inverse AddTweakKey and AddRoundConstant
+            for cell, bit in round_keys[round_num]:
+                state[cell][bit] ^= ones
+            if tweak_keys is not None:
+                for cell, bit, sources in tweak_keys[round_num]:
+                    for word, source_cell, source_bit in sources:
+                        state[cell][bit] ^= tweak_state[word][source_cell][source_bit]
+
+            # Inverse S-box Layer
+            state = [sbox_inv(cell, ones) for cell in state]
+        return state
+
+    def bitsliced_keystream(self, block_count):
+        counters = [(self.counter + x) & self.block_mask for x in range(block_count)]
+        self.counter = (self.counter + block_count) & self.block_mask
+        return self.bitsliced_blocks(counters, self.bitsliced_encrypt_function)
+
+    def bitsliced_blocks(self, blocks, function, round_keys=None, tweaks=None):
+        if round_keys is None:
+            if self.bitslice_round_keys is None:
+                self.setup_bitslice_engine()
+            round_keys = self.bitslice_round_keys
+
+        # Per block tweaks are transposed alongside the blocks and added on top of the shared round keys
+        tweak_keys = tweak_state = None
+        if tweaks is not None:
+            self.check_tweak_words()
+            round_keys, tweak_keys, tweak_state = self.bitslice_tweaks(tweaks)
+        ones = (1 << len(blocks)) - 1
+        state = function(self.bitslice_blocks(blocks), ones, round_keys, tweak_keys, tweak_state)
+        return self.unbitslice_blocks(state, len(blocks))
+
+    def encrypt_bitsliced(self, blocks):
+        """
+        Encrypt many independent blocks at once with the bitsliced engine.
+        :param blocks: Iterable of int plaintext blocks
+        :return: List of int ciphertext blocks
+        """
+        blocks = [block & self.block_mask for block in blocks]
+        if not blocks:
+            return []
 
-        # Prepare Based On Mode
         if self.mode == 'ECB':
-            internal_state = ciphertext_state
-            internal_state = self.decrypt_function(internal_state)
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
-        
+            return self.bitsliced_blocks(blocks, self.bitsliced_encrypt_function)
+
         elif self.mode == 'CTR':
-            internal_state = self.int_to_state(self.counter)
-            self.counter += 1
-            internal_state = self.encrypt_function(internal_state)
-            internal_state = [array('B', map(xor, ciphertext_state[x], internal_state[x])) for x in range(4)]
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
+            return [block ^ key for block, key in zip(blocks, self.bitsliced_keystream(len(blocks)))]
 
-        elif self.mode == 'CBC':
-            internal_state = self.decrypt_function(ciphertext_state)
-            internal_state = [array('B', map(xor, internal_state[x], self.iv[x])) for x in range(4)]
-            self.iv = ciphertext_state
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
+        print('Invalid cipher mode for bitsliced processing!')
+        print('Please use one of the following block cipher modes:', ['ECB', 'CTR'])
+        raise ValueError('Bitsliced processing requires independent blocks')
 
-        elif self.mode == 'PCBC':
-            internal_state = self.decrypt_function(ciphertext_state)
-            internal_state = [array('B', map(xor, internal_state[x], self.iv[x])) for x in range(4)]
-            self.iv = [array('B', map(xor, internal_state[x], ciphertext_state[x])) for x in range(4)]
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
+    def decrypt_bitsliced(self, blocks):
+        """
+        Decrypt many independent blocks at once with the bitsliced engine.
+        :param blocks: Iterable of int ciphertext blocks
+        :return: List of int plaintext blocks
+        """
+        blocks = [block & self.block_mask for block in blocks]
+        if not blocks:
+            return []
 
-        elif self.mode == 'CFB':
-            internal_state = self.encrypt_function(self.iv)
-            internal_state = [array('B', map(xor, ciphertext_state[x], internal_state[x])) for x in range(4)]
-            self.iv = ciphertext_state
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
+        if self.mode == 'ECB':
+            return self.bitsliced_blocks(blocks, self.bitsliced_decrypt_function)
 
-        elif self.mode == 'OFB':
-            internal_state = self.encrypt_function(self.iv)
-            self.iv = internal_state
-            internal_state = [array('B', map(xor, ciphertext_state[x], internal_state[x])) for x in range(4)]
-            plaintext = self.state_to_int(internal_state)
-            return plaintext
+        elif self.mode == 'CTR':
+            return [block ^ key for block, key in zip(blocks, self.bitsliced_keystream(len(blocks)))]
+
+        print('Invalid cipher mode for bitsliced processing!')
+        print('Please use one of the following block cipher modes:', ['ECB', 'CTR'])
+        raise ValueError('Bitsliced processing requires independent blocks')
+
+    def setup_numpy_engine(self):
+        # Lookup tables and round tweakeys as arrays for vectorized rounds over many blocks
+        if self.s_val == 4:
+            self.numpy_sbox = np.array(self.sbox4, dtype=np.uint8)
+            self.numpy_sbox_inv = np.array(self.sbox4_inv, dtype=np.uint8)
+        else:
+            self.numpy_sbox = np.array(self.sbox8, dtype=np.uint8)
+            self.numpy_sbox_inv = np.array(self.sbox8_inv, dtype=np.uint8)
+        self.numpy_shift_rows = np.array([0, 1, 2, 3, 7, 4, 5, 6, 10, 11, 8, 9, 13, 14, 15, 12])
+        self.numpy_inv_shift_rows = np.array([0, 1, 2, 3, 5, 6, 7, 4, 10, 11, 8, 9, 15, 12, 13, 14])
+        self.numpy_round_keys = np.array([self.int_to_state(self.pack_round_tweakey(round_num))
+                                          for round_num in range(self.rounds)], dtype=np.uint8).reshape(-1, 16)
+
+    def numpy_blocks_to_cells(self, blocks):
+        # Accept (N, 16) uint8 cells, (N,) uint64 blocks for 64 bit blocks or (N, 2) uint64 blocks
+        # holding the high and low halves of 128 bit blocks
+        if blocks.dtype == np.uint8 and blocks.ndim == 2 and blocks.shape[1] == 16:
+            return blocks & self.cell_size
+        if blocks.dtype == np.uint64 and blocks.shape[1:] == ((2,) if self.block_size == 128 else ()):
+            block_bytes = blocks.astype('>u8').view(np.uint8).reshape(-1, self.block_size >> 3)
+            return self.numpy_bytes_to_cells(block_bytes)
+        print('Invalid block array!')
+        print('Please Provide an (N, 16) uint8 cell array or an uint64 block array of shape',
+              '(N, 2)' if self.block_size == 128 else '(N,)')
+        raise ValueError('Unsupported block array layout')
+
+    def numpy_bytes_to_cells(self, block_bytes):
+        if self.s_val == 8:
+            return block_bytes.copy()
+        cells = np.empty((block_bytes.shape[0], 16), dtype=np.uint8)
+        cells[:, 0::2] = block_bytes >> 4
+        cells[:, 1::2] = block_bytes & 0xF
+        return cells
+
+    def numpy_cells_to_blocks(self, cells, blocks):
+        # Return processed cells in the same layout the blocks were given in
+        if blocks.dtype == np.uint8:
+            return cells
+        if self.s_val == 4:
+            cells = (cells[:, 0::2] << 4) | cells[:, 1::2]
+        return np.ascontiguousarray(cells).view('>u8').reshape(blocks.shape).astype(np.uint64)
+
+    def numpy_counter_cells(self, block_count):
+        # Consecutive counter blocks, wrapping at the block size like self.counter does
+        offsets = np.arange(block_count, dtype=np.uint64)
+        if self.block_size == 64:
+            counters = (np.uint64(self.counter) + offsets).reshape(-1, 1)
+        else:
+            high = np.uint64(self.counter >> 64)
+            low = np.uint64(self.counter & 0xFFFFFFFFFFFFFFFF)
+            counters = np.empty((block_count, 2), dtype=np.uint64)
+            counters[:, 1] = low + offsets
+            counters[:, 0] = high + (counters[:, 1] < low).astype(np.uint64)
+        self.counter = (self.counter + block_count) & self.block_mask
+        block_bytes = counters.astype('>u8').view(np.uint8).reshape(-1, self.block_size >> 3)
+        return self.numpy_bytes_to_cells(block_bytes)
+
+    def numpy_encrypt_function(self, cells):
+        for round_num in range(self.rounds):
+            # S-box Layer
+            cells = self.numpy_sbox[cells]
 
-    def decrypt_function(self, internal_state):
+            # AddRoundConstant and AddTweakKey
+            cells ^= self.numpy_round_keys[round_num]
 
+            # Shift Rows
+            cells = cells[:, self.numpy_shift_rows]
+
+            # MixColumns
+            mix_2 = cells[:, 0:4] ^ cells[:, 8:12]
+            cells = np.concatenate((cells[:, 12:16] ^ mix_2, cells[:, 0:4], cells[:, 4:8] ^ cells[:, 8:12], mix_2),
+                                   axis=1)
+        return cells
+
+    def numpy_decrypt_function(self, cells):
         for round_num in range(self.rounds - 1, -1, -1):
-            
             # Inverse Mix Columns
-            mix_1 = array('B', map(xor, internal_state[0], internal_state[3]))
-            mix_2 = array('B', map(xor, internal_state[1], internal_state[3]))
-            mix_3 = array('B', map(xor, internal_state[2], mix_2))
-            internal_state = [internal_state[1], mix_3, mix_2, mix_1]
+            mix_1 = cells[:, 0:4] ^ cells[:, 12:16]
+            mix_2 = cells[:, 4:8] ^ cells[:, 12:16]
+            cells = np.concatenate((cells[:, 4:8], cells[:, 8:12] ^ mix_2, mix_2, mix_1), axis=1)
 
             # Inverse Shift Rows
-            internal_state = [internal_state[0],
-                              array('B', [internal_state[1][1], internal_state[1][2], internal_state[1][3], internal_state[1][0]]),
-                              array('B', [internal_state[2][2], internal_state[2][3], internal_state[2][0], internal_state[2][1]]),
-                              array('B', [internal_state[3][3], internal_state[3][0], internal_state[3][1], internal_state[3][2]])]
-
-            # Inverse AddTweakKey
-            internal_state[0] = array('B', map(xor, internal_state[0], self.key_schedule[round_num][0]))
-            internal_state[1] = array('B', map(xor, internal_state[1], self.key_schedule[round_num][1]))
-
-            # Inverse AddRoundConstant
-            round_constant = self.round_constants[round_num]
-            c0 = round_constant & 0xF
-            c1 = round_constant >> 4
-            c2 = 0x2
-            internal_state[0][0] ^= c0
-            internal_state[1][0] ^= c1    
-            internal_state[2][0] ^= c2
+            cells = cells[:, self.numpy_inv_shift_rows]
+
+            # Inverse AddTweakKey and AddRoundConstant
+            cells ^= self.numpy_round_keys[round_num]
 
             # Inverse S-box Layer
-            if self.s_val == 4:
-                sbox_state = [array('B', [self.sbox4_inv[state_nib] for state_nib in state_row]) for state_row in internal_state]
-            else:
-                sbox_state = [array('B', [self.sbox8_inv[state_byte] for state_byte in state_row]) for state_row in internal_state]
-                
-            internal_state = sbox_state
-        return internal_state   
+            cells = self.numpy_sbox_inv[cells]
+        return cells
+
+    def numpy_blocks(self, blocks, function):
+        if np is None:
+            print('NumPy is required for vectorized block processing!')
+            print('Please install numpy or use encrypt_bitsliced/decrypt_bitsliced')
+            raise ImportError('numpy is not available')
+        if self.numpy_round_keys is None:
+            self.setup_numpy_engine()
+
+        blocks = np.asarray(blocks)
+        cells = self.numpy_blocks_to_cells(blocks)
+        if self.mode == 'ECB':
+            cells = function(cells)
+        elif self.mode == 'CTR':
+            cells ^= self.numpy_encrypt_function(self.numpy_counter_cells(cells.shape[0]))
+        else:
+            print('Invalid cipher mode for vectorized processing!')
+            print('Please use one of the following block cipher modes:', ['ECB', 'CTR'])
+            raise ValueError('Vectorized processing requires independent blocks')
+        return self.numpy_cells_to_blocks(cells, blocks)
+
+    def encrypt_blocks(self, blocks):
+        """
+        Encrypt an array of blocks with rounds vectorized across all blocks (requires numpy).
+        :param blocks: (N, 16) uint8 cell array, (N,) uint64 array of 64 bit blocks or
+                       (N, 2) uint64 array of 128 bit blocks as [high, low] halves
+        :return: Array of ciphertext blocks in the same layout
+        """
+        return self.numpy_blocks(blocks, self.numpy_encrypt_function)
+
+    def decrypt_blocks(self, blocks):
+        """
+        Decrypt an array of blocks with rounds vectorized across all blocks (requires numpy).
+        :param blocks: (N, 16) uint8 cell array, (N,) uint64 array of 64 bit blocks or
+                       (N, 2) uint64 array of 128 bit blocks as [high, low] halves
+        :return: Array of plaintext blocks in the same layout
+        """
+        return self.numpy_blocks(blocks, self.numpy_decrypt_function)
+
+    def encrypt_block_list(self, blocks, tweak=None):
+        # Block function over a list of blocks, bitsliced once the batch is large enough to pay off
+        if len(blocks) < self.bitslice_threshold:
+            encrypt_block = self.encrypt_block if tweak is None else self.tweak_encrypt_block(tweak)
+            return [encrypt_block(block) for block in blocks]
+        round_keys = None if tweak is None else self.bitslice_flips(self.tweak_round_keys(tweak, False))
+        return self.bitsliced_blocks(blocks, self.bitsliced_encrypt_function, round_keys)
+
+    def decrypt_block_list(self, blocks, tweak=None):
+        if len(blocks) < self.bitslice_threshold:
+            decrypt_block = self.decrypt_block if tweak is None else self.tweak_decrypt_block(tweak)
+            return [decrypt_block(block) for block in blocks]
+        round_keys = None if tweak is None else self.bitslice_flips(self.tweak_round_keys(tweak, False))
+        return self.bitsliced_blocks(blocks, self.bitsliced_decrypt_function, round_keys)
+
+    def tweaked_block_list(self, blocks, tweaks, encrypting):
+        if len(blocks) != len(tweaks):
+            print('Invalid tweak list!')
+            print('Please Provide one tweak per block')
+            raise ValueError('Block and tweak counts differ')
+        if len(blocks) < self.bitslice_threshold:
+            tweak_block = self.tweak_encrypt_block if encrypting else self.tweak_decrypt_block
+            return [tweak_block(tweak)(block) for block, tweak in zip(blocks, tweaks)]
+        function = self.bitsliced_encrypt_function if encrypting else self.bitsliced_decrypt_function
+        return self.bitsliced_blocks(blocks, function, tweaks=tweaks)
+
+    def encrypt_tweaked_block_list(self, blocks, tweaks):
+        """
+        Encrypt a list of blocks, each under its own tweak, bitsliced for large batches.
+        :param blocks: List of int plaintext blocks
+        :param tweaks: List of int tweaks holding the configured tweak words, one per block
+        :return: List of int ciphertext blocks
+        """
+        return self.tweaked_block_list(blocks, tweaks, True)
+
+    def decrypt_tweaked_block_list(self, blocks, tweaks):
+        """
+        Decrypt a list of blocks, each under its own tweak, bitsliced for large batches.
+        :param blocks: List of int ciphertext blocks
+        :param tweaks: List of int tweaks holding the configured tweak words, one per block
+        :return: List of int plaintext blocks
+        """
+        return self.tweaked_block_list(blocks, tweaks, False)
+
+    def unpack_block(self, buffer, offset):
+        high, low = self.block_struct.unpack_from(buffer, offset)
+        return (high << self.word_size) | low
+
+    def pack_block(self, buffer, offset, block):
+        self.block_struct.pack_into(buffer, offset, block >> self.word_size, block & self.word_mask)
+
+
+class SkinnyKey:
+    """
+    Immutable expanded key, shared by any number of SkinnyContext streams and threads.
+    It only exposes the block functions, chaining state lives in the contexts.
+    """
+
+    # Key parameters and block functions taken from the expanded cipher once, the contexts read them directly
+    __fields = ('key', 'key_size', 'block_size', 'rounds', 'engine', 'block_mask', 'bitslice_batch', 'tweak_words',
+                'tweak_bits', 'key_schedule', 'encrypt_block', 'decrypt_block', 'tweak_encrypt_block',
+                'tweak_decrypt_block', 'encrypt_block_list', 'decrypt_block_list', 'encrypt_tweaked_block_list',
+                'decrypt_tweaked_block_list', 'unpack_block', 'pack_block')
+    __slots__ = ('_cipher',) + __fields
+
+    def __init__(self, key, key_size=128, block_size=128, engine='state', tweak_words=(), rounds=None):
+        """
+        Expand a key once for use by many streams.
+        :param key: Int representation of the encryption key
+        :param key_size: Int representing the encryption key in bits
+        :param block_size: Int representing the block size in bits
+        :param engine: String representing which round engine should compute the block function
+        :param tweak_words: Tuple of tweakey word numbers supplied as a tweak per call, see SkinnyCipher
+        :param rounds: Int number of rounds for a reduced round variant, None for the full number of rounds
+        :return: None
+        """
+        self.__bind(SkinnyCipher(key, key_size, block_size, engine=engine, tweak_words=tweak_words, rounds=rounds))
+
+    def __bind(self, cipher):
+        # The cipher is private to the key, nothing outside can rebind its block functions
+        object.__setattr__(self, '_cipher', cipher)
+        for name in self.__fields:
+            object.__setattr__(self, name, getattr(cipher, name))
+
+    @classmethod
+    def from_cipher(cls, cipher):
+        """
+        Share the expanded key of an existing cipher without running the key schedule.
+        The key is taken from a copy, later changes to cipher do not reach the key.
+        :param cipher: SkinnyCipher instance
+        :return: SkinnyKey
+        """
+        # A plain copy still shares the engine state and the bound block functions of cipher, rebuild them
+        clone = copy(cipher)
+        clone.setup_engine()
+        key = cls.__new__(cls)
+        key.__bind(clone)
+        return key
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SkinnyKey is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('SkinnyKey is immutable')
+
+    def __reduce__(self):
+        return SkinnyKey.from_cipher, (self._cipher,)
+
+    def context(self, mode='ECB', init=0, counter=0):
+        """
+        Start a new stream under this key.
+        :param mode: String representing which cipher block mode the stream should use
+        :param init: IV for CTR, CBC, PCBC, CFB, and OFB modes
+        :param counter: Initial Counter value for CTR mode
+        :return: SkinnyContext
+        """
+        return SkinnyContext(self, mode, init, counter)
+
+
+class SkinnyContext(SkinnyModes):
+    """
+    Lightweight per-stream mode state (ECB, CTR, CBC, PCBC, CFB or OFB) over a shared SkinnyKey.
+    Offers the same encrypt/decrypt and buffer interface as SkinnyCipher, starting a new stream
+    costs no key schedule work.
+    """
+    __slots__ = ('key', 'mode', 'iv', 'counter', 'initial_counter')
+
+    def __init__(self, key, mode='ECB', init=0, counter=0):
+        """
+        Initialize a stream over an expanded key.
+        :param key: SkinnyKey instance
+        :param mode: String representing which cipher block mode the stream should use
+        :param init: IV for CTR, CBC, PCBC, CFB, and OFB modes
+        :param counter: Initial Counter value for CTR mode
+        :return: None
+        """
+        self.key = key
+        self.setup_mode(mode, init, counter)
+
+    block_size = property(attrgetter('key.block_size'))
+    block_mask = property(attrgetter('key.block_mask'))
+    tweak_bits = property(attrgetter('key.tweak_bits'))
+    bitslice_batch = property(attrgetter('key.bitslice_batch'))
+    encrypt_block = property(attrgetter('key.encrypt_block'))
+    decrypt_block = property(attrgetter('key.decrypt_block'))
+    tweak_encrypt_block = property(attrgetter('key.tweak_encrypt_block'))
+    tweak_decrypt_block = property(attrgetter('key.tweak_decrypt_block'))
+    encrypt_block_list = property(attrgetter('key.encrypt_block_list'))
+    decrypt_block_list = property(attrgetter('key.decrypt_block_list'))
+    encrypt_tweaked_block_list = property(attrgetter('key.encrypt_tweaked_block_list'))
+    decrypt_tweaked_block_list = property(attrgetter('key.decrypt_tweaked_block_list'))
+    unpack_block = property(attrgetter('key.unpack_block'))
+    pack_block = property(attrgetter('key.pack_block'))
+
+
+class SkinnyCtrStream:
+    """
+    Random access view of the CTR keystream of a SkinnyCipher.
+    The counter of any block is computed from the initial counter of the cipher, so the cipher itself
+    is never advanced and any number of streams can share one expanded key.
+    """
+
+    def __init__(self, cipher, offset=0):
+        """
+        Initialize a seekable CTR keystream.
+        :param cipher: SkinnyCipher instance initialized in CTR mode
+        :param offset: Int byte offset to start the stream at
+        :return: None
+        """
+        if cipher.mode != 'CTR':
+            print('Invalid cipher mode!')
+            print('Please Provide a cipher initialized in CTR mode')
+            raise ValueError('Keystream access requires a CTR mode cipher')
+        self.cipher = cipher
+        self.block_bytes = cipher.block_size >> 3
+        self.position = 0
+        self.seek(offset)
+
+    def seek(self, offset, whence=0):
+        """
+        Move the stream position.
+        :param offset: Int byte offset
+        :param whence: 0 for absolute positioning, 1 for relative to the current position
+        :return: Int new absolute position
+        """
+        if whence == 1:
+            offset += self.position
+        elif whence != 0:
+            print('Invalid whence value!')
+            print('Please use 0 (absolute) or 1 (relative)')
+            raise ValueError('Unsupported whence value')
+        if offset < 0:
+            print('Invalid stream offset!')
+            print('Please Provide a non-negative offset')
+            raise ValueError('Negative stream offset')
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def keystream_at(self, offset, length):
+        """
+        Compute keystream bytes without moving the stream position.
+        :param offset: Int byte offset into the keystream
+        :param length: Int number of keystream bytes
+        :return: bytes
+        """
+        if offset < 0:
+            print('Invalid stream offset!')
+            print('Please Provide a non-negative offset')
+            raise ValueError('Negative stream offset')
+        if length < 0:
+            print('Invalid keystream length!')
+            print('Please Provide a non-negative length')
+            raise ValueError('Negative keystream length')
+        first_block = offset // self.block_bytes
+        last_block = (offset + length + self.block_bytes - 1) // self.block_bytes
+        counters = [(self.cipher.initial_counter + x) & self.cipher.block_mask for x in range(first_block, last_block)]
+        keystream = bytearray(len(counters) * self.block_bytes)
+        for position, block in enumerate(self.cipher.encrypt_block_list(counters)):
+            self.cipher.pack_block(keystream, position * self.block_bytes, block)
+
+        # Trim partial leading and trailing blocks
+        start = offset - first_block * self.block_bytes
+        return bytes(keystream[start:start + length])
+
+    def read_keystream(self, length):
+        """
+        Read keystream bytes at the current position and advance past them.
+        :param length: Int number of keystream bytes
+        :return: bytes
+        """
+        keystream = self.keystream_at(self.position, length)
+        self.position += length
+        return keystream
+
+    def xor_at(self, offset, data):
+        """
+        Encrypt or decrypt data located at a byte offset of the CTR stream.
+        :param offset: Int byte offset of the first byte of data
+        :param data: bytes-like object
+        :return: bytes
+        """
+        data = bytes(data)
+        keystream = self.keystream_at(offset, len(data))
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(len(data), 'big')
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,158 @@
+from __future__ import print_function
+from hmac import compare_digest
+from skinny import SkinnyCipher
+
+
+class SkinnyAead:
+    """
+    SKINNY-AEAD M1: nonce based authenticated encryption with associated data following the ThetaCB3
+    construction over SKINNY-128-384. The tweakey is TK1 = block counter LFSR and domain separation,
+    TK2 = 128 bit nonce and TK3 = 128 bit key. Message and associated data blocks are independent,
+    so full blocks are processed in bitsliced batches with a separate tweak per block.
+    """
+
+    # Domain separation values of the tweakey
+    domain_message = 0x00
+    domain_message_padded = 0x01
+    domain_ad = 0x02
+    domain_ad_padded = 0x03
+    domain_tag = 0x04
+    domain_tag_padded = 0x05
+
+    block_bytes = 16
+
+    def __init__(self, key, engine='table'):
+        """
+        Initialize SKINNY-AEAD under a key.
+        :param key: Int representation of the 128 bit key
+        :param engine: String representing which round engine computes single blocks
+        :return: None
+        """
+        try:
+            key_int = key & ((2 ** 128) - 1)
+        except (ValueError, TypeError):
+            print('Invalid Key Value!')
+            print('Please Provide Key as int')
+            raise
+
+        # TK1 and TK2 change with every block and nonce, only TK3 belongs to the key schedule
+        self.cipher = SkinnyCipher(key_int, 384, 128, engine=engine, tweak_words=(1, 2))
+
+    def lfsr_sequence(self, lfsr, count):
+        # Block counters: 64 bit LFSR with feedback polynomial x^64 + x^4 + x^3 + x + 1, starting at 1 per pass.
+        # Returns count consecutive values from lfsr and the value following them
+        values = []
+        for x in range(count):
+            values.append(lfsr)
+            lfsr = ((lfsr << 1) & 0xFFFFFFFFFFFFFFFF) ^ (0x1B if lfsr >> 63 else 0)
+        return values, lfsr
+
+    def tweak(self, nonce, lfsr, domain):
+        # TK1 holds the LFSR in little endian byte order, zero padding and the domain in its last byte
+        tk1 = int.from_bytes(lfsr.to_bytes(8, 'little') + bytes(7) + bytes(bytearray([domain])), 'big')
+        return (tk1 << 128) | nonce
+
+    def pad(self, data):
+        # 10* padding of a partial block
+        return int.from_bytes(bytes(data) + b'\x80' + bytes(self.block_bytes - 1 - len(data)), 'big')
+
+    def process_blocks(self, nonce, view, domain, encrypting, dst=None):
+        """
+        Run every full block of a buffer through the cipher under its own counter tweak, a bitsliced batch
+        at a time, so counters, tweaks and block ints only ever exist for one batch.
+        :param nonce: Int 128 bit nonce
+        :param view: Byte memoryview of the data, a partial final block is left alone
+        :param domain: Int domain separation byte of the full blocks
+        :param encrypting: Bool, True to encrypt and False to decrypt the blocks
+        :param dst: Optional writable buffer receiving the processed blocks at the same offsets
+        :return: Tuple of the counter after the last full block, the XOR of all input blocks and the
+                 XOR of all output blocks
+        """
+        function = self.cipher.encrypt_tweaked_block_list if encrypting else self.cipher.decrypt_tweaked_block_list
+        batch_bytes = self.cipher.bitslice_batch * self.block_bytes
+        full_length = len(view) - len(view) % self.block_bytes
+        lfsr = 1
+        input_sum = output_sum = 0
+        for batch_offset in range(0, full_length, batch_bytes):
+            offsets = range(batch_offset, min(batch_offset + batch_bytes, full_length), self.block_bytes)
+            blocks = [int.from_bytes(view[offset:offset + self.block_bytes], 'big') for offset in offsets]
+            lfsrs, lfsr = self.lfsr_sequence(lfsr, len(blocks))
+            tweaks = [self.tweak(nonce, value, domain) for value in lfsrs]
+            for offset, block, processed in zip(offsets, blocks, function(blocks, tweaks)):
+                input_sum ^= block
+                output_sum ^= processed
+                if dst is not None:
+                    dst[offset:offset + self.block_bytes] = processed.to_bytes(self.block_bytes, 'big')
+        return lfsr, input_sum, output_sum
+
+    def parse_nonce(self, nonce):
+        try:
+            return nonce & ((2 ** 128) - 1)
+        except (ValueError, TypeError):
+            print('Invalid Nonce Value!')
+            print('Please Provide Nonce as int')
+            raise
+
+    def authenticate(self, nonce, associated_data):
+        # XOR of the encrypted associated data blocks
+        with memoryview(associated_data) as data_view, data_view.cast('B') as view:
+            lfsr, ad_sum, auth = self.process_blocks(nonce, view, self.domain_ad, True)
+            final = view[len(view) - len(view) % self.block_bytes:]
+            if final:
+                tweak = self.tweak(nonce, lfsr, self.domain_ad_padded)
+                auth ^= self.cipher.tweak_encrypt_block(tweak)(self.pad(final))
+        return auth
+
+    def tag(self, nonce, checksum, lfsr, padded, associated_data):
+        domain = self.domain_tag_padded if padded else self.domain_tag
+        tag = self.cipher.tweak_encrypt_block(self.tweak(nonce, lfsr, domain))(checksum)
+        return (tag ^ self.authenticate(nonce, associated_data)).to_bytes(self.block_bytes, 'big')
+
+    def process_final(self, nonce, lfsr, final, output):
+        # A partial last block is XORed with a keystream block, the counter moves on for the tag
+        pad = self.cipher.tweak_encrypt_block(self.tweak(nonce, lfsr, self.domain_message_padded))(0)
+        output[len(output) - len(final):] = bytes(bytearray(a ^ b for a, b in
+                                                            zip(final, pad.to_bytes(self.block_bytes, 'big'))))
+        return self.lfsr_sequence(lfsr, 1)[1]
+
+    def encrypt(self, nonce, plaintext, associated_data=b''):
+        """
+        Encrypt and authenticate a message in a single pass.
+        :param nonce: Int 128 bit nonce, must never repeat under one key
+        :param plaintext: bytes-like message of any length
+        :param associated_data: bytes-like data authenticated but not encrypted
+        :return: Tuple of ciphertext bytes (same length as plaintext) and 16 byte tag
+        """
+        nonce = self.parse_nonce(nonce)
+        with memoryview(plaintext) as data_view, data_view.cast('B') as view:
+            ciphertext = bytearray(len(view))
+            lfsr, checksum, encrypted_sum = self.process_blocks(nonce, view, self.domain_message, True, ciphertext)
+            final = bytes(view[len(view) - len(view) % self.block_bytes:])
+        if final:
+            lfsr = self.process_final(nonce, lfsr, final, ciphertext)
+            checksum ^= self.pad(final)
+        return bytes(ciphertext), self.tag(nonce, checksum, lfsr, bool(final), associated_data)
+
+    def decrypt(self, nonce, ciphertext, tag, associated_data=b''):
+        """
+        Verify and decrypt a message.
+        :param nonce: Int 128 bit nonce the message was encrypted under
+        :param ciphertext: bytes-like ciphertext
+        :param tag: bytes-like 16 byte tag
+        :param associated_data: bytes-like data authenticated alongside the message
+        :return: Plaintext bytes, only returned when the tag is valid
+        """
+        nonce = self.parse_nonce(nonce)
+        with memoryview(ciphertext) as data_view, data_view.cast('B') as view:
+            plaintext = bytearray(len(view))
+            lfsr, encrypted_sum, checksum = self.process_blocks(nonce, view, self.domain_message, False, plaintext)
+            final = bytes(view[len(view) - len(view) % self.block_bytes:])
+        if final:
+            lfsr = self.process_final(nonce, lfsr, final, plaintext)
+            checksum ^= self.pad(plaintext[len(plaintext) - len(final):])
+
+        if not compare_digest(self.tag(nonce, checksum, lfsr, bool(final), associated_data), bytes(tag)):
+            print('Invalid Tag!')
+            print('Ciphertext, associated data or nonce were modified')
+            raise ValueError('Authentication failed')
+        return bytes(plaintext)
@@ -0,0 +1,95 @@
+from __future__ import print_function
+import asyncio
+from time import perf_counter
+from skinny_stream import SkinnyStream
+
+
+class AsyncEncryptor:
+    """
+    asyncio streaming encryption and decryption over a SkinnyCipher or SkinnyContext.
+    Chunks at or above inline_threshold bytes are processed in an executor so the event loop keeps running,
+    smaller chunks are processed inline. Chunks are processed strictly one after another, so the chaining
+    state of the cipher stays consistent across awaits. The executor must run in this process (threads),
+    since the chaining state lives on the cipher.
+    """
+
+    def __init__(self, cipher, padding=None, chunk_size=1 << 16, inline_threshold=4096, executor=None):
+        """
+        Initialize an asyncio streaming layer around a keyed cipher.
+        :param cipher: SkinnyCipher or SkinnyContext
+        :param padding: None, 'pkcs7' or 'cts', see SkinnyStream
+        :param chunk_size: Int maximum number of bytes read from a StreamReader per chunk
+        :param inline_threshold: Int chunk size in bytes from which chunks are offloaded to the executor
+        :param executor: concurrent.futures executor running in this process, None for the loop default
+        :return: None
+        """
+        self.stream = SkinnyStream(cipher, padding, chunk_size)
+        self.inline_threshold = inline_threshold
+        self.executor = executor
+        self.offloaded = 0
+
+    async def update(self, chunk):
+        # Large chunks leave the event loop, small ones cost less than the hand over
+        if len(chunk) >= self.inline_threshold:
+            self.offloaded += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.stream.update, chunk)
+        return self.stream.update(chunk)
+
+    async def iter_process(self, reader, encrypting):
+        self.stream.begin(encrypting)
+        while True:
+            chunk = await reader.read(self.stream.chunk_size)
+            if not chunk:
+                break
+            output = await self.update(chunk)
+            if output:
+                yield output
+        output = self.stream.finalize()
+        if output:
+            yield output
+
+    def iter_encrypt(self, reader):
+        """
+        Encrypt everything a reader yields.
+        :param reader: asyncio.StreamReader or any object with an async read(n) returning b'' at the end
+        :return: Async generator of ciphertext bytes chunks, for use with async for
+        """
+        return self.iter_process(reader, True)
+
+    def iter_decrypt(self, reader):
+        """
+        Decrypt everything a reader yields.
+        :param reader: asyncio.StreamReader or any object with an async read(n) returning b'' at the end
+        :return: Async generator of plaintext bytes chunks, for use with async for
+        """
+        return self.iter_process(reader, False)
+
+    async def process_stream(self, reader, writer, encrypting):
+        start = perf_counter()
+        async for output in self.iter_process(reader, encrypting):
+            writer.write(output)
+            # Backpressure, nothing more is read until the transport has taken what was written
+            await writer.drain()
+        seconds = perf_counter() - start
+        stats = dict(self.stream.stats)
+        stats['seconds'] = seconds
+        stats['throughput'] = stats['bytes_in'] / seconds if seconds else 0.0
+        return stats
+
+    async def encrypt_stream(self, reader, writer):
+        """
+        Encrypt everything a StreamReader yields into a StreamWriter.
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter, drained after every chunk
+        :return: Dict of bytes_in, bytes_out, cipher_seconds, seconds and throughput (input bytes per second)
+        """
+        return await self.process_stream(reader, writer, True)
+
+    async def decrypt_stream(self, reader, writer):
+        """
+        Decrypt everything a StreamReader yields into a StreamWriter.
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter, drained after every chunk
+        :return: Dict of bytes_in, bytes_out, cipher_seconds, seconds and throughput (input bytes per second)
+        """
+        return await self.process_stream(reader, writer, False)
@@ -0,0 +1,204 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from time import perf_counter
+from skinny import SkinnyCipher
+
+# Every (block_size, key_size) configuration and mode of SkinnyCipher
+CONFIGS = [(64, 64), (64, 128), (64, 192), (128, 128), (128, 256), (128, 384)]
+MODES = ['ECB', 'CTR', 'CBC', 'PCBC', 'CFB', 'OFB']
+ENGINES = ['state', 'table', 'unrolled', 'swar']
+
+# Bulk mode and direction pairs that batch blocks through the bitsliced block lists, the other pairs chain
+# one block at a time through the block function of the engine
+BITSLICED = [('ECB', 'encrypt'), ('ECB', 'decrypt'), ('CTR', 'encrypt'), ('CTR', 'decrypt'),
+             ('CBC', 'decrypt'), ('CFB', 'decrypt')]
+
+
+def cpu_frequency():
+    # Nominal clock in Hz, used to turn seconds into cycles, None when the platform does not report it
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                if line.lower().startswith('cpu mhz'):
+                    return float(line.split(':')[1]) * 1e6
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def machine_metadata(cpu_hz):
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'cpu_hz': cpu_hz,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'numpy': numpy_version}
+
+
+def best_time(function, repeat):
+    # Fastest of several runs, the least disturbed by the rest of the machine
+    best = None
+    for x in range(repeat):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def key_setup_time(key, key_size, block_size, engine, repeat):
+    # Schedules and generated code are timed from scratch, the process wide caches would otherwise hide them
+    caches = SkinnyCipher.key_cache, SkinnyCipher.unrolled_cache
+    SkinnyCipher.key_cache = SkinnyCipher.unrolled_cache = None
+    try:
+        return best_time(lambda: SkinnyCipher(key, key_size, block_size, engine=engine), repeat)
+    finally:
+        SkinnyCipher.key_cache, SkinnyCipher.unrolled_cache = caches
+
+
+def bulk_result(common, key, mode, direction, data, path, repeat, cpu_hz):
+    c = SkinnyCipher(key, common['key_size'], common['block_size'], mode, init=1, counter=1,
+                     engine=common['engine'] or 'state')
+    # Pin the measured path: every block list bitsliced, or none so the engine computes every block
+    c.bitslice_threshold = 1 if path == 'bitsliced' else len(data) + 1
+    function = c.encrypt_buffer if direction == 'encrypt' else c.decrypt_buffer
+    seconds = best_time(lambda: function(data), repeat)
+    return dict(common, benchmark='bulk', mode=mode, direction=direction, path=path, bytes=len(data),
+                seconds=seconds, mb_per_s=len(data) / seconds / 1e6,
+                cycles_per_byte=seconds * cpu_hz / len(data) if cpu_hz else None)
+
+
+def run_benchmarks(configs=CONFIGS, modes=MODES, engines=ENGINES, data_bytes=4096, repeat=3, cpu_hz=None):
+    """
+    Measure key setup, single block latency and bulk throughput.
+    Bulk rows of an engine run its own block function on every block, the bitsliced block lists that
+    ECB, CTR and CBC/CFB decryption otherwise use are measured once per configuration with engine None.
+    :param configs: List of (block_size, key_size) tuples
+    :param modes: List of cipher mode strings for the bulk measurements
+    :param engines: List of round engine strings
+    :param data_bytes: Int number of bytes per bulk measurement, rounded down to whole blocks
+    :param repeat: Int number of runs per measurement, the fastest one is reported
+    :param cpu_hz: Optional CPU clock in Hz for cycles per byte, read from the platform when None
+    :return: Dict of machine metadata and a list of results
+    """
+    cpu_hz = cpu_hz or cpu_frequency()
+    results = []
+    for block_size, key_size in configs:
+        block_bytes = block_size >> 3
+        key = int.from_bytes(os.urandom(key_size >> 3), 'big')
+        data = os.urandom(max(data_bytes // block_bytes, 1) * block_bytes)
+        for engine in engines:
+            # The SWAR engine only exists for 64 bit blocks
+            if engine == 'swar' and block_size != 64:
+                continue
+            common = {'block_size': block_size, 'key_size': key_size, 'engine': engine}
+            results.append(dict(common, benchmark='key_setup',
+                                seconds=key_setup_time(key, key_size, block_size, engine, repeat)))
+
+            c = SkinnyCipher(key, key_size, block_size, engine=engine)
+            for direction, function in [('encrypt', c.encrypt_block), ('decrypt', c.decrypt_block)]:
+                results.append(dict(common, benchmark='block_latency', direction=direction,
+                                    seconds=best_time(lambda: function(0x0123456789ABCDEF), repeat)))
+
+            for mode in modes:
+                for direction in ['encrypt', 'decrypt']:
+                    results.append(bulk_result(common, key, mode, direction, data, 'engine', repeat, cpu_hz))
+
+        # The bitsliced path does not depend on the engine
+        common = {'block_size': block_size, 'key_size': key_size, 'engine': None}
+        for mode, direction in BITSLICED:
+            if mode in modes:
+                results.append(bulk_result(common, key, mode, direction, data, 'bitsliced', repeat, cpu_hz))
+    return {'metadata': machine_metadata(cpu_hz), 'results': results}
+
+
+def result_key(result):
+    return tuple(result.get(name) for name in ('benchmark', 'block_size', 'key_size', 'engine', 'mode', 'direction',
+                                                  'path'))
+
+
+def result_cost(result):
+    # Seconds per byte for bulk runs so differently sized runs stay comparable
+    return result['seconds'] / result['bytes'] if 'bytes' in result else result['seconds']
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compare two benchmark runs.
+    :param baseline: Dict as returned by run_benchmarks
+    :param current: Dict as returned by run_benchmarks
+    :param threshold: Float relative slowdown from which a measurement counts as a regression
+    :return: List of (key, ratio, regressed) for the measurements present in both runs,
+             ratio being current cost over baseline cost
+    """
+    baseline_costs = dict((result_key(result), result_cost(result)) for result in baseline['results'])
+    comparison = []
+    for result in current['results']:
+        key = result_key(result)
+        if key in baseline_costs and baseline_costs[key] > 0:
+            ratio = result_cost(result) / baseline_costs[key]
+            comparison.append((key, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def format_key(key):
+    return ' '.join(str(part) for part in key if part is not None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SKINNY cipher benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run the benchmarks and write JSON results')
+    run.add_argument('--output', default='-', help='JSON output file, - for stdout')
+    run.add_argument('--configs', nargs='+', default=['{}/{}'.format(*config) for config in CONFIGS],
+                     help='block_size/key_size configurations')
+    run.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    run.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    run.add_argument('--bytes', type=int, default=4096, help='bytes per bulk measurement')
+    run.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest is kept')
+    run.add_argument('--cpu-hz', type=float, default=None, help='CPU clock for cycles per byte')
+
+    compare = commands.add_parser('compare', help='flag regressions against a baseline')
+    compare.add_argument('baseline', help='baseline JSON results')
+    compare.add_argument('current', help='current JSON results')
+    compare.add_argument('--threshold', type=float, default=0.1, help='relative slowdown counted as regression')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        configs = [tuple(int(size) for size in config.split('/')) for config in args.configs]
+        results = run_benchmarks(configs, args.modes, args.engines, args.bytes, args.repeat, args.cpu_hz)
+        if args.output == '-':
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, 'w') as output:
+                json.dump(results, output, indent=2)
+        return 0
+
+    if args.command == 'compare':
+        with open(args.baseline) as baseline, open(args.current) as current:
+            comparison = compare_results(json.load(baseline), json.load(current), args.threshold)
+        for key, ratio, regressed in comparison:
+            print('{:<10} {:6.2f}x  {}'.format('REGRESSED' if regressed else 'ok', ratio, format_key(key)))
+        return 1 if any(regressed for key, ratio, regressed in comparison) else 0
+
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
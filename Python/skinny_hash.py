@@ -0,0 +1,129 @@
+from __future__ import print_function
+from binascii import hexlify
+from struct import Struct
+from skinny import SkinnyCipher
+
+
+class SkinnyHash:
+    """
+    Common sponge of SKINNY-tk3-Hash and SKINNY-tk2-Hash with a hashlib style streaming interface.
+    The whole sponge state is the tweakey of a SKINNY-128 instance, and the permutation encrypts the
+    constant blocks 0^128, 0x01 || 0^120, ... under it and concatenates the results. Every permutation
+    call therefore needs a new tweakey. The state is loaded as the tweak of one shared cipher whose tweakey
+    words are all tweak words, so it goes through the linear tweak tables instead of a key schedule per call.
+    """
+
+    digest_size = 32
+
+    # Permutation ciphers, built once per state size: key_size: SkinnyCipher
+    __ciphers = {}
+
+    def __init__(self, data=b''):
+        """
+        Start a new hash.
+        :param data: Optional initial bytes-like message data
+        :return: None
+        """
+        if self.key_size not in self.__ciphers:
+            self.__ciphers[self.key_size] = SkinnyCipher(0, self.key_size, 128, engine='table',
+                                                         tweak_words=range(1, self.key_size // 128 + 1))
+        self.cipher = self.__ciphers[self.key_size]
+
+        # The first bit of the capacity is set, the rate starts out zero
+        self.state = 1 << (self.key_size - self.block_size * 8 - 1)
+        self.buffer = bytearray()
+        self.update(data)
+
+    def permutation(self, state):
+        # F256/F384: the state is the tweakey, the new state the encryptions of the constant blocks
+        # 0^128, 0x01 || 0^120 and 0x02 || 0^120, the constant in the first byte of the block
+        round_keys = self.cipher.tweak_round_keys(state, True)
+        output = 0
+        for constant in range(self.key_size // 128):
+            output = (output << 128) | self.cipher.table_encrypt(constant << 120, round_keys)
+        return output
+
+    def absorb(self, state, view):
+        # XOR every whole block of a buffer into the rate, the top bits of the state, and permute.
+        # The rate Struct unpacks the blocks straight from the buffer as big endian words
+        for words in self.rate_struct.iter_unpack(view):
+            for word, shift in zip(words, self.rate_shifts):
+                state ^= word << shift
+            state = self.permutation(state)
+        return state
+
+    def update(self, data):
+        """
+        Add message data.
+        :param data: bytes-like object
+        :return: None
+        """
+        with memoryview(data) as data_view, data_view.cast('B') as view:
+            # Top up a partial block from an earlier call first, whole blocks are absorbed straight from data
+            start = 0
+            if self.buffer:
+                start = min(self.block_size - len(self.buffer), len(view))
+                self.buffer += view[:start]
+                if len(self.buffer) < self.block_size:
+                    return
+                self.state = self.absorb(self.state, self.buffer)
+                del self.buffer[:]
+
+            end = start + ((len(view) - start) // self.block_size) * self.block_size
+            self.state = self.absorb(self.state, view[start:end])
+            self.buffer += view[end:]
+
+    def digest(self):
+        """
+        Hash of the data so far, more data can still be added afterwards.
+        :return: bytes of length digest_size
+        """
+        # 10* padding always adds a block, then the digest is squeezed 128 bits at a time
+        padded = bytes(self.buffer) + b'\x80' + bytes(self.block_size - 1 - len(self.buffer))
+        state = self.absorb(self.state, padded)
+        output = b''
+        while True:
+            output += (state >> (self.key_size - 128)).to_bytes(16, 'big')
+            if len(output) == self.digest_size:
+                return output
+            state = self.permutation(state)
+
+    def hexdigest(self):
+        return hexlify(self.digest()).decode('ascii')
+
+    def copy(self):
+        """
+        Independent copy of the hash, e.g. to hash several messages sharing a prefix.
+        :return: Hash object of the same class
+        """
+        other = self.__class__.__new__(self.__class__)
+        other.cipher = self.cipher
+        other.state = self.state
+        other.buffer = bytearray(self.buffer)
+        return other
+
+
+class SkinnyTk3Hash(SkinnyHash):
+    """
+    SKINNY-tk3-Hash: 384 bit sponge over SKINNY-128-384 absorbing 128 bits per permutation call.
+    """
+    name = 'skinny-tk3-hash'
+    key_size = 384
+    block_size = 16
+
+    # The rate block as two 64 bit words and their positions in the state
+    rate_struct = Struct('>QQ')
+    rate_shifts = (320, 256)
+
+
+class SkinnyTk2Hash(SkinnyHash):
+    """
+    SKINNY-tk2-Hash: 256 bit sponge over SKINNY-128-256 absorbing 32 bits per permutation call.
+    """
+    name = 'skinny-tk2-hash'
+    key_size = 256
+    block_size = 4
+
+    # The rate block as one 32 bit word and its position in the state
+    rate_struct = Struct('>I')
+    rate_shifts = (224,)
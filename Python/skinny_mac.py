@@ -0,0 +1,138 @@
+from __future__ import print_function
+from binascii import hexlify
+
+
+class SkinnyMac:
+    """
+    Common streaming interface of the block cipher MACs. Input is buffered so the final block,
+    which both MACs treat specially, is only consumed by digest(). Subclasses process whole blocks.
+    """
+
+    # Reduction constants of the doubling in GF(2^n), block_size: constant
+    __reduction = {64: 0x1B, 128: 0x87}
+
+    def __init__(self, cipher, data=b''):
+        """
+        Initialize a MAC over a keyed cipher.
+        :param cipher: SkinnyCipher, SkinnyKey or SkinnyContext, its mode is not used
+        :param data: Optional initial bytes-like message data
+        :return: None
+        """
+        self.cipher = cipher
+        self.block_bytes = cipher.block_size >> 3
+        self.digest_size = self.block_bytes
+        self.block_mask = cipher.block_mask
+        self.buffer = bytearray()
+        self.setup_subkeys(cipher.encrypt_block(0))
+        self.update(data)
+
+    def double(self, value):
+        # Multiplication by x in GF(2^n)
+        carry = value >> (self.cipher.block_size - 1)
+        return ((value << 1) & self.block_mask) ^ (self.__reduction[self.cipher.block_size] if carry else 0)
+
+    def halve(self, value):
+        # Multiplication by x^-1 in GF(2^n), the inverse of double
+        if value & 1:
+            return (value >> 1) ^ (1 << (self.cipher.block_size - 1)) ^ (self.__reduction[self.cipher.block_size] >> 1)
+        return value >> 1
+
+    def pad(self, data):
+        # 10* padding of a partial block
+        return int.from_bytes(bytes(data) + b'\x80' + bytes(self.block_bytes - 1 - len(data)), 'big')
+
+    def update(self, data):
+        """
+        Add message data.
+        :param data: bytes-like object
+        :return: None
+        """
+        self.buffer += data
+
+        # Everything but the last block is processed, a batch of the bulk path at a time
+        batch_bytes = self.cipher.bitslice_batch * self.block_bytes
+        ready = ((len(self.buffer) - 1) // self.block_bytes) * self.block_bytes
+        if ready <= 0:
+            return
+        with memoryview(self.buffer) as view:
+            for offset in range(0, ready, batch_bytes):
+                end = min(offset + batch_bytes, ready)
+                self.process_blocks([self.cipher.unpack_block(view, block_offset)
+                                     for block_offset in range(offset, end, self.block_bytes)])
+        del self.buffer[:ready]
+
+    def digest(self):
+        """
+        MAC of the data so far, more data can still be added afterwards.
+        :return: bytes of length digest_size
+        """
+        return self.finalize(bytes(self.buffer)).to_bytes(self.block_bytes, 'big')
+
+    def hexdigest(self):
+        return hexlify(self.digest()).decode('ascii')
+
+
+class SkinnyCmac(SkinnyMac):
+    """
+    CMAC (NIST SP 800-38B) over a SKINNY block cipher with 64 or 128 bit blocks.
+    """
+
+    def setup_subkeys(self, l_value):
+        self.k1 = self.double(l_value)
+        self.k2 = self.double(self.k1)
+        self.state = 0
+
+    def process_blocks(self, blocks):
+        # CBC chain, every block depends on the previous one
+        encrypt_block = self.cipher.encrypt_block
+        state = self.state
+        for block in blocks:
+            state = encrypt_block(state ^ block)
+        self.state = state
+
+    def finalize(self, final):
+        if len(final) == self.block_bytes:
+            last = int.from_bytes(final, 'big') ^ self.k1
+        else:
+            last = self.pad(final) ^ self.k2
+        return self.cipher.encrypt_block(self.state ^ last)
+
+
+class SkinnyPmac(SkinnyMac):
+    """
+    PMAC (Black and Rogaway) over a SKINNY block cipher with 64 or 128 bit blocks. Every block but
+    the last is encrypted independently under its own Gray code offset, so blocks go through the
+    batched block path.
+    """
+
+    def setup_subkeys(self, l_value):
+        self.l_values = [l_value]
+        self.l_inverse = self.halve(l_value)
+        self.offset = 0
+        self.count = 0
+        self.checksum = 0
+
+    def process_blocks(self, blocks):
+        # Offset of block i is the previous offset XOR L * x^ntz(i)
+        masked = []
+        offset = self.offset
+        for block in blocks:
+            self.count += 1
+            trailing_zeros = (self.count & -self.count).bit_length() - 1
+            while trailing_zeros >= len(self.l_values):
+                self.l_values.append(self.double(self.l_values[-1]))
+            offset ^= self.l_values[trailing_zeros]
+            masked.append(block ^ offset)
+        self.offset = offset
+
+        checksum = self.checksum
+        for encrypted in self.cipher.encrypt_block_list(masked):
+            checksum ^= encrypted
+        self.checksum = checksum
+
+    def finalize(self, final):
+        if len(final) == self.block_bytes:
+            last = int.from_bytes(final, 'big') ^ self.l_inverse
+        else:
+            last = self.pad(final)
+        return self.cipher.encrypt_block(self.checksum ^ last)
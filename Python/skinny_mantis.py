@@ -0,0 +1,376 @@
+from __future__ import print_function
+from array import array
+from functools import partial
+from struct import Struct
+from skinny import SkinnyCipher, SkinnyModes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class MantisCipher(SkinnyModes):
+    """
+    MANTIS, the low latency tweakable block cipher of the SKINNY family: 64 bit blocks, a 128 bit key k0 || k1,
+    a 64 bit tweak and 5 to 8 rounds on either side of a middle layer. The rounds are reflected around that
+    layer, so decryption is encryption with k0 and k0' swapped and k1 replaced by k1 ^ alpha, and both
+    directions run mantis_function on their own round keys. There is no key schedule, a tweak is folded
+    into the round keys by a handful of table lookups.
+    """
+
+    # Midori S-box Sb0, an involution, so SubCells is its own inverse
+    sbox = array('B', [12, 10, 13, 3, 14, 11, 15, 7, 8, 9, 1, 5, 0, 2, 4, 6])
+
+    # PermuteCells, cell i of the next state is cell P[i] of the current one
+    cell_permutation = array('B', [0, 11, 6, 13, 10, 1, 12, 7, 5, 14, 3, 8, 15, 4, 9, 2])
+    cell_permutation_inv = array('B', [0, 5, 15, 10, 13, 8, 2, 7, 11, 14, 4, 1, 6, 3, 9, 12])
+
+    # Tweak cell permutation h, applied before every forward round and undone after every backward round
+    tweak_permutation = array('B', [6, 5, 14, 15, 0, 1, 2, 3, 7, 12, 13, 4, 8, 9, 10, 11])
+    tweak_permutation_inv = array('B', [4, 5, 6, 7, 11, 1, 0, 8, 12, 13, 14, 15, 9, 10, 2, 3])
+
+    # Round constants RC0 to RC7 and the reflection constant alpha, all taken from the digits of pi
+    round_constants = [0x13198A2E03707344, 0xA4093822299F31D0, 0x082EFA98EC4E6C89, 0x452821E638D01377,
+                       0xBE5466CF34E90C6C, 0xC0AC29B7C97C50DD, 0x3F84D5B5B5470917, 0x9216D5D98979FB1B]
+    alpha = 0x243F6A8885A308D3
+
+    # MANTIS-r for r rounds on either side of the middle layer
+    __valid_rounds = [5, 6, 7, 8]
+
+    # Fixed geometry, named like the SkinnyCipher attributes the shared mode and buffer code reads
+    block_size = 64
+    word_size = 32
+    s_val = 4
+    cell_size = 0xF
+    block_mask = 0xFFFFFFFFFFFFFFFF
+    word_mask = 0xFFFFFFFF
+    tweak_bits = 64
+    tweak_mask = 0xFFFFFFFFFFFFFFFF
+    block_struct = Struct('>II')
+
+    # Buffer and sector calls hand at most this many blocks to the block list functions at once
+    bitslice_batch = 1024
+
+    # Fused S-box/linear layer tables and the S-box as a byte translation, key independent and built on first use:
+    # [forward_tables, middle_tables, backward_tables, sbox_translation]
+    __round_tables = []
+
+    # Tweak contributions to the round keys of MANTIS-r, linear in the tweak: rounds: byte_tables
+    __tweak_tables = {}
+
+    def __init__(self, key, rounds=8, mode='ECB', init=0, counter=0, tweak=0):
+        """
+        Initialize an instance of the MANTIS tweakable block cipher.
+        :param key: Int representation of the 128 bit key k0 || k1
+        :param rounds: Int number of rounds on either side of the middle layer, 5 up to 8
+        :param mode: String representing which cipher block mode the object should initialize with
+        :param init: IV for CTR, CBC, PCBC, CFB, and OFB modes
+        :param counter: Initial Counter value for CTR mode
+        :param tweak: Int 64 bit tweak used whenever a call does not supply its own
+        :return: None
+        """
+        if rounds not in self.__valid_rounds:
+            print('Invalid number of rounds!')
+            print('Please use one of the following numbers of rounds:', self.__valid_rounds)
+            raise ValueError('Invalid number of rounds')
+        self.rounds = rounds
+
+        try:
+            self.key = key & ((2 ** 128) - 1)
+            self.tweak = tweak & self.tweak_mask
+        except (ValueError, TypeError):
+            print('Invalid Key or Tweak Value!')
+            print('Please Provide Key and Tweak as int')
+            raise
+
+        # Setup IV, counter and cipher mode
+        self.setup_mode(mode, init, counter)
+
+        self.setup_tables()
+
+        # Whitening key k0 yields the output whitening key k0' = (k0 >>> 1) ^ (k0 >> 63)
+        self.k0 = self.key >> 64
+        self.k1 = self.key & self.block_mask
+        self.k0_prime = ((self.k0 >> 1) | (self.k0 << 63)) & self.block_mask ^ (self.k0 >> 63)
+
+        # Key only round keys per direction, decryption is encryption under the reflected key
+        self.encrypt_keys = self.join_round_keys(self.reflection_round_keys(self.k0, self.k0_prime, self.k1))
+        self.decrypt_keys = self.join_round_keys(self.reflection_round_keys(self.k0_prime, self.k0,
+                                                                            self.k1 ^ self.alpha))
+
+        # Round keys of the last tweak seen per direction, keyed by encrypting
+        self.tweak_memo = {True: (None, None), False: (None, None)}
+        self.numpy_round_keys = None
+
+    def permute_cells(self, value, permutation):
+        digits = format(value, '016x')
+        return int(''.join(digits[x] for x in permutation), 16)
+
+    def mix_columns(self, value):
+        # Every cell becomes the XOR of the other three cells of its column, so every row is XORed with the
+        # XOR of all four rows
+        rows = value ^ (value >> 16) ^ (value >> 32) ^ (value >> 48)
+        return value ^ ((rows & 0xFFFF) * 0x0001000100010001)
+
+    def setup_tables(self):
+        # Build the fused round tables on first use, byte position j holds the cells 2j and 2j + 1
+        if not self.__round_tables:
+            translation = bytes(bytearray((self.sbox[x >> 4] << 4) | self.sbox[x & 0xF] for x in range(256)))
+            tables = ([], [], [])
+            for position in range(8):
+                shift = (7 - position) << 3
+                forward, middle, backward = [], [], []
+                for value in range(256):
+                    cells = translation[value] << shift
+                    forward.append(self.mix_columns(self.permute_cells(cells, self.cell_permutation)))
+                    middle.append(self.mix_columns(cells))
+                    backward.append(self.permute_cells(self.mix_columns(cells), self.cell_permutation_inv))
+                for table_list, table in zip(tables, (forward, middle, backward)):
+                    table_list.append(tuple(table))
+            self.__round_tables.extend(tables + (translation,))
+        forward_tables, middle_tables, backward_tables, self.sbox_translation = self.__round_tables
+        self.round_tables = [forward_tables] * self.rounds + [middle_tables] + [backward_tables] * self.rounds
+
+        if self.rounds not in self.__tweak_tables:
+            self.__tweak_tables[self.rounds] = self.build_tweak_tables()
+        self.tweak_tables = self.__tweak_tables[self.rounds]
+
+    def reflection_round_keys(self, k0, k0_prime, k1, tweak=0):
+        """
+        Round keys in the order mantis_function adds them, for the encryption key (k0, k0', k1).
+        The reflected key (k0', k0, k1 ^ alpha) gives the round keys of decryption.
+        :param k0: Int 64 bit whitening key of the input
+        :param k0_prime: Int 64 bit whitening key of the output
+        :param k1: Int 64 bit round key
+        :param tweak: Int 64 bit tweak
+        :return: List of 2 * rounds + 3 packed int round keys
+        """
+        tweaks = [tweak]
+        for round_num in range(self.rounds):
+            tweaks.append(self.permute_cells(tweaks[-1], self.tweak_permutation))
+
+        # Forward round keys are added before PermuteCells/MixColumns, so they are folded through them
+        round_keys = [k0 ^ k1 ^ tweak]
+        for round_num in range(self.rounds):
+            round_key = self.round_constants[round_num] ^ k1 ^ tweaks[round_num + 1]
+            round_keys.append(self.mix_columns(self.permute_cells(round_key, self.cell_permutation)))
+
+        # The middle layer has no key, backward rounds add theirs after undoing MixColumns/PermuteCells
+        round_keys.append(0)
+        for round_num in range(self.rounds - 1, -1, -1):
+            round_keys.append(self.round_constants[round_num] ^ k1 ^ self.alpha ^ tweaks[round_num + 1])
+        round_keys.append(k0_prime ^ k1 ^ self.alpha ^ tweak)
+        return round_keys
+
+    def join_round_keys(self, round_keys):
+        # Concatenate packed round keys into one int, the first round key in the least significant block
+        joined = 0
+        for round_key in reversed(round_keys):
+            joined = (joined << 64) | round_key
+        return joined
+
+    def build_tweak_tables(self):
+        # Round keys are affine in the tweak, so the contribution of a tweak is the XOR of the contributions
+        # of its bits. Bits are combined eight at a time into 256 entry byte tables
+        constants = self.reflection_round_keys(0, 0, 0)
+        basis = []
+        for bit in range(63, -1, -1):
+            round_keys = self.reflection_round_keys(0, 0, 0, 1 << bit)
+            basis.append(self.join_round_keys([round_key ^ constant
+                                               for round_key, constant in zip(round_keys, constants)]))
+
+        tables = []
+        for position in range(0, 64, 8):
+            table = [0]
+            for bit_contribution in reversed(basis[position:position + 8]):
+                table += [entry ^ bit_contribution for entry in table]
+            tables.append(tuple(table))
+        return tables
+
+    def tweak_round_keys(self, tweak, encrypting):
+        """
+        Round keys of mantis_function under a tweak.
+        :param tweak: Int 64 bit tweak
+        :param encrypting: Bool, True for encryption and False for decryption round keys
+        :return: List of packed int round keys
+        """
+        memo_tweak, round_keys = self.tweak_memo[encrypting]
+        if round_keys is not None and memo_tweak == tweak:
+            return round_keys
+
+        try:
+            tweak_bytes = (tweak & self.tweak_mask).to_bytes(8, 'big')
+        except (ValueError, TypeError, AttributeError):
+            print('Invalid Tweak Value!')
+            print('Please Provide Tweak as int')
+            raise TypeError('Tweak must be an int')
+
+        joined = self.encrypt_keys if encrypting else self.decrypt_keys
+        for table, byte_val in zip(self.tweak_tables, tweak_bytes):
+            joined ^= table[byte_val]
+        round_keys = [(joined >> (x << 6)) & self.block_mask for x in range(2 * self.rounds + 3)]
+        self.tweak_memo[encrypting] = (tweak, round_keys)
+        return round_keys
+
+    def mantis_function(self, block, round_keys):
+        # Whitening, then forward rounds, the middle layer and backward rounds as fused table rounds whose
+        # S-box is applied by the next table round, the last S-box layer is a byte translation
+        block ^= round_keys[0]
+        for (t0, t1, t2, t3, t4, t5, t6, t7), round_key in zip(self.round_tables, round_keys[1:]):
+            c0, c1, c2, c3, c4, c5, c6, c7 = block.to_bytes(8, 'big')
+            block = round_key ^ t0[c0] ^ t1[c1] ^ t2[c2] ^ t3[c3] ^ t4[c4] ^ t5[c5] ^ t6[c6] ^ t7[c7]
+        return int.from_bytes(block.to_bytes(8, 'big').translate(self.sbox_translation), 'big') ^ round_keys[-1]
+
+    def encrypt_block(self, block):
+        return self.mantis_function(block, self.tweak_round_keys(self.tweak, True))
+
+    def decrypt_block(self, block):
+        return self.mantis_function(block, self.tweak_round_keys(self.tweak, False))
+
+    def tweak_encrypt_block(self, tweak):
+        """
+        Block encryption function under a tweak.
+        :param tweak: Int 64 bit tweak
+        :return: Function mapping an int plaintext block to an int ciphertext block
+        """
+        return partial(self.mantis_function, round_keys=self.tweak_round_keys(tweak, True))
+
+    def tweak_decrypt_block(self, tweak):
+        """
+        Block decryption function under a tweak.
+        :param tweak: Int 64 bit tweak
+        :return: Function mapping an int ciphertext block to an int plaintext block
+        """
+        return partial(self.mantis_function, round_keys=self.tweak_round_keys(tweak, False))
+
+    def encrypt_block_list(self, blocks, tweak=None):
+        encrypt_block = self.tweak_encrypt_block(self.tweak if tweak is None else tweak)
+        return [encrypt_block(block) for block in blocks]
+
+    def decrypt_block_list(self, blocks, tweak=None):
+        decrypt_block = self.tweak_decrypt_block(self.tweak if tweak is None else tweak)
+        return [decrypt_block(block) for block in blocks]
+
+    def tweaked_block_list(self, blocks, tweaks, encrypting):
+        if len(blocks) != len(tweaks):
+            print('Invalid tweak list!')
+            print('Please Provide one tweak per block')
+            raise ValueError('Block and tweak counts differ')
+        tweak_block = self.tweak_encrypt_block if encrypting else self.tweak_decrypt_block
+        return [tweak_block(tweak)(block) for block, tweak in zip(blocks, tweaks)]
+
+    def encrypt_tweaked_block_list(self, blocks, tweaks):
+        """
+        Encrypt a list of blocks, each under its own tweak.
+        :param blocks: List of int plaintext blocks
+        :param tweaks: List of int 64 bit tweaks, one per block
+        :return: List of int ciphertext blocks
+        """
+        return self.tweaked_block_list(blocks, tweaks, True)
+
+    def decrypt_tweaked_block_list(self, blocks, tweaks):
+        """
+        Decrypt a list of blocks, each under its own tweak.
+        :param blocks: List of int ciphertext blocks
+        :param tweaks: List of int 64 bit tweaks, one per block
+        :return: List of int plaintext blocks
+        """
+        return self.tweaked_block_list(blocks, tweaks, False)
+
+    def setup_numpy_engine(self):
+        # Cell arrays of the per direction keys, the round constants and the permutations for vectorized rounds
+        k0, k0_prime, k1 = self.k0, self.k0_prime, self.k1
+        keys = np.array([k0 ^ k1, k1, k0_prime ^ k1 ^ self.alpha, k0_prime ^ k1 ^ self.alpha, k1 ^ self.alpha, k0 ^ k1]
+                        + self.round_constants[:self.rounds], dtype=np.uint64)
+        cells = self.numpy_blocks_to_cells(keys)
+        self.numpy_round_keys = {True: cells[0:3], False: cells[3:6]}
+        self.numpy_round_constants = cells[6:]
+        self.numpy_alpha = self.numpy_blocks_to_cells(np.array([self.alpha], dtype=np.uint64))[0]
+        self.numpy_sbox = np.array(self.sbox, dtype=np.uint8)
+        self.numpy_permutations = [np.array(permutation) for permutation in
+                                   (self.cell_permutation, self.cell_permutation_inv,
+                                    self.tweak_permutation, self.tweak_permutation_inv)]
+
+    def numpy_mix_columns(self, cells):
+        columns = cells[:, 0:4] ^ cells[:, 4:8] ^ cells[:, 8:12] ^ cells[:, 12:16]
+        return cells ^ np.tile(columns, 4)
+
+    def numpy_function(self, cells, tweak_cells, encrypting):
+        whitening_in, k1, whitening_out = self.numpy_round_keys[encrypting]
+        permutation, permutation_inv, tweak_permutation, tweak_permutation_inv = self.numpy_permutations
+        sbox = self.numpy_sbox
+
+        cells = cells ^ whitening_in ^ tweak_cells
+        for round_num in range(self.rounds):
+            tweak_cells = tweak_cells[:, tweak_permutation]
+            cells = sbox[cells] ^ self.numpy_round_constants[round_num] ^ k1 ^ tweak_cells
+            cells = self.numpy_mix_columns(cells[:, permutation])
+
+        cells = sbox[self.numpy_mix_columns(sbox[cells])]
+
+        for round_num in range(self.rounds - 1, -1, -1):
+            cells = self.numpy_mix_columns(cells)[:, permutation_inv]
+            cells = sbox[cells ^ self.numpy_round_constants[round_num] ^ k1 ^ self.numpy_alpha ^ tweak_cells]
+            tweak_cells = tweak_cells[:, tweak_permutation_inv]
+        return cells ^ whitening_out ^ tweak_cells
+
+    def numpy_blocks(self, blocks, tweaks, encrypting):
+        if np is None:
+            print('NumPy is required for vectorized block processing!')
+            print('Please install numpy or use encrypt_block_list/decrypt_block_list')
+            raise ImportError('numpy is not available')
+        if self.numpy_round_keys is None:
+            self.setup_numpy_engine()
+
+        blocks = np.asarray(blocks)
+        cells = self.numpy_blocks_to_cells(blocks)
+        if tweaks is None:
+            tweaks = self.tweak
+        try:
+            tweaks = np.array(tweaks, dtype=np.uint64).reshape(-1)
+        except (ValueError, TypeError, OverflowError):
+            print('Invalid Tweak Value!')
+            print('Please Provide one int tweak or one tweak per block')
+            raise ValueError('Tweaks must be ints')
+        if tweaks.shape[0] not in (1, cells.shape[0]):
+            print('Invalid number of tweaks!')
+            print('Please Provide one tweak or one tweak per block')
+            raise ValueError('Block and tweak counts differ')
+        tweak_cells = self.numpy_blocks_to_cells(tweaks)
+
+        if self.mode == 'ECB':
+            cells = self.numpy_function(cells, tweak_cells, encrypting)
+        elif self.mode == 'CTR':
+            cells ^= self.numpy_function(self.numpy_counter_cells(cells.shape[0]), tweak_cells, True)
+        else:
+            print('Invalid cipher mode for vectorized processing!')
+            print('Please use one of the following block cipher modes:', ['ECB', 'CTR'])
+            raise ValueError('Vectorized processing requires independent blocks')
+        return self.numpy_cells_to_blocks(cells, blocks)
+
+    def encrypt_blocks(self, blocks, tweaks=None):
+        """
+        Encrypt an array of blocks with rounds vectorized across all blocks (requires numpy).
+        :param blocks: (N, 16) uint8 cell array or (N,) uint64 block array
+        :param tweaks: Optional int tweak for all blocks, or a list or (N,) uint64 array of one tweak per block
+        :return: Array of ciphertext blocks in the same layout
+        """
+        return self.numpy_blocks(blocks, tweaks, True)
+
+    def decrypt_blocks(self, blocks, tweaks=None):
+        """
+        Decrypt an array of blocks with rounds vectorized across all blocks (requires numpy).
+        :param blocks: (N, 16) uint8 cell array or (N,) uint64 block array
+        :param tweaks: Optional int tweak for all blocks, or a list or (N,) uint64 array of one tweak per block
+        :return: Array of plaintext blocks in the same layout
+        """
+        return self.numpy_blocks(blocks, tweaks, False)
+
+    # Cell layout conversions and block packing are shared with the 64 bit SkinnyCipher configurations
+    numpy_blocks_to_cells = SkinnyCipher.numpy_blocks_to_cells
+    numpy_bytes_to_cells = SkinnyCipher.numpy_bytes_to_cells
+    numpy_cells_to_blocks = SkinnyCipher.numpy_cells_to_blocks
+    numpy_counter_cells = SkinnyCipher.numpy_counter_cells
+    unpack_block = SkinnyCipher.unpack_block
+    pack_block = SkinnyCipher.pack_block
@@ -0,0 +1,139 @@
+from __future__ import print_function
+from skinny import SkinnyCipher
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SkinnyMultiKey:
+    """
+    Many keys of one SKINNY configuration expanded together and used together (requires numpy).
+    The key schedule runs once for all keys, the tweakey permutation as an index gather and the LFSRs
+    as bit operations on whole arrays, and every key encrypts or decrypts its own block in a single
+    vectorized call. Meant for key agility workloads such as key verification and known answer tests.
+    """
+
+    def __init__(self, keys, key_size=128, block_size=128):
+        """
+        Expand many keys at once.
+        :param keys: Iterable of int keys, or (M, key_size / 8) uint8 array of big endian key bytes
+        :param key_size: Int representing the encryption key in bits
+        :param block_size: Int representing the block size in bits
+        :return: None
+        """
+        if np is None:
+            print('NumPy is required for multi key processing!')
+            print('Please install numpy or expand the keys one by one with SkinnyCipher')
+            raise ImportError('numpy is not available')
+
+        # Geometry, tables and the vectorized rounds are taken from a cipher of the same configuration
+        self.cipher = SkinnyCipher(0, key_size, block_size)
+        self.cipher.setup_numpy_engine()
+        self.key_size = self.cipher.key_size
+        self.block_size = self.cipher.block_size
+        self.rounds = self.cipher.rounds
+
+        key_bytes = self.parse_keys(keys)
+        self.key_count = key_bytes.shape[0]
+        self.round_tweakeys = self.expand_keys(key_bytes)
+
+        # Round constants are added to the same cells of every key: c0 to cell 0, c1 to cell 4 and 0x2 to cell 8
+        constants = np.zeros((self.rounds, 16), dtype=np.uint8)
+        round_constants = np.array(self.cipher.round_constants[:self.rounds], dtype=np.uint8)
+        constants[:, 0] = round_constants & 0xF
+        constants[:, 4] = round_constants >> 4
+        constants[:, 8] = 0x2
+
+        # Per round (M, 16) additions, as the vectorized round functions of the cipher index them
+        round_keys = np.zeros((self.rounds, self.key_count, 16), dtype=np.uint8)
+        round_keys[:, :, :8] = self.round_tweakeys.reshape(self.key_count, self.rounds, 8).transpose(1, 0, 2)
+        round_keys ^= constants[:, np.newaxis, :]
+        self.cipher.numpy_round_keys = round_keys
+
+    def parse_keys(self, keys):
+        key_length = self.key_size >> 3
+        if isinstance(keys, np.ndarray):
+            if keys.dtype != np.uint8 or keys.ndim != 2 or keys.shape[1] != key_length:
+                print('Invalid key array!')
+                print('Please Provide an (M, {}) uint8 array of key bytes'.format(key_length))
+                raise ValueError('Unsupported key array layout')
+            return keys
+        try:
+            key_mask = (2 ** self.key_size) - 1
+            data = b''.join((key & key_mask).to_bytes(key_length, 'big') for key in keys)
+        except (ValueError, TypeError, AttributeError):
+            print('Invalid Key Value!')
+            print('Please Provide Keys as ints')
+            raise TypeError('Keys must be ints')
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, key_length)
+
+    def expand_keys(self, key_bytes):
+        """
+        Run the key schedule of every key at once.
+        :param key_bytes: (M, key_size / 8) uint8 array of big endian key bytes
+        :return: (M, rounds, 2, 4) uint8 array, rows 0 and 1 of the round tweakey of every key and round
+        """
+        cipher = self.cipher
+        words = cipher.tweak_size
+        tweakey = cipher.numpy_bytes_to_cells(key_bytes.reshape(-1, self.block_size >> 3)).reshape(-1, words, 16)
+        permutation = np.array(cipher.tweakey_permutation, dtype=np.intp)
+
+        round_tweakeys = np.empty((key_bytes.shape[0], self.rounds, 8), dtype=np.uint8)
+        for round_num in range(self.rounds):
+            round_tweakeys[:, round_num] = np.bitwise_xor.reduce(tweakey[:, :, :8], axis=1)
+            tweakey = tweakey[:, :, permutation]
+            for word_index in range(1, words):
+                tweakey[:, word_index, :8] = cipher.lfsr_cell(word_index, tweakey[:, word_index, :8])
+        return round_tweakeys.reshape(-1, self.rounds, 2, 4)
+
+    def process(self, blocks, function):
+        # Every key takes the block at its own position, a single block is shared by all keys
+        if isinstance(blocks, np.ndarray):
+            cells = self.cipher.numpy_blocks_to_cells(blocks)
+        else:
+            try:
+                data = b''.join((block & self.cipher.block_mask).to_bytes(self.block_size >> 3, 'big')
+                                for block in blocks)
+            except (ValueError, TypeError, AttributeError):
+                print('Invalid Block Value!')
+                print('Please Provide Blocks as ints or as a block array')
+                raise TypeError('Blocks must be ints')
+            block_bytes = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.block_size >> 3)
+            cells = self.cipher.numpy_bytes_to_cells(block_bytes)
+
+        if cells.shape[0] == 1:
+            cells = np.repeat(cells, self.key_count, axis=0)
+        elif cells.shape[0] != self.key_count:
+            print('Invalid number of blocks!')
+            print('Please Provide one block per key or a single block for all', self.key_count, 'keys')
+            raise ValueError('Block count does not match key count')
+
+        cells = function(cells)
+        if isinstance(blocks, np.ndarray):
+            return self.cipher.numpy_cells_to_blocks(cells, blocks if blocks.shape[0] == self.key_count else
+                                                     np.repeat(blocks, self.key_count, axis=0))
+        if self.cipher.s_val == 4:
+            cells = (cells[:, 0::2] << 4) | cells[:, 1::2]
+        data = cells.tobytes()
+        block_bytes = self.block_size >> 3
+        return [int.from_bytes(data[offset:offset + block_bytes], 'big') for offset in range(0, len(data), block_bytes)]
+
+    def encrypt(self, blocks):
+        """
+        Encrypt block i under key i.
+        :param blocks: List of int blocks, or a block array as accepted by SkinnyCipher.encrypt_blocks,
+                       holding one block per key or a single block encrypted under every key
+        :return: List of int ciphertext blocks or an array in the layout given
+        """
+        return self.process(blocks, self.cipher.numpy_encrypt_function)
+
+    def decrypt(self, blocks):
+        """
+        Decrypt block i under key i.
+        :param blocks: List of int blocks, or a block array as accepted by SkinnyCipher.decrypt_blocks,
+                       holding one block per key or a single block decrypted under every key
+        :return: List of int plaintext blocks or an array in the layout given
+        """
+        return self.process(blocks, self.cipher.numpy_decrypt_function)
@@ -0,0 +1,234 @@
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+# Keyed cipher of the current worker process, installed once by the pool initializer
+_worker_cipher = None
+
+
+def _init_worker(cipher):
+    global _worker_cipher
+    _worker_cipher = cipher
+
+
+def _process_chunk(encrypting, chunk, iv, counter):
+    # Every chunk starts from the chaining state the parent computed for its first block
+    _worker_cipher.iv = iv
+    _worker_cipher.counter = counter
+    return bytes(_worker_cipher.process_buffer(chunk, None, encrypting))
+
+
+def _process_sectors(encrypting, chunk, first_sector, sector_size):
+    return bytes(_worker_cipher.process_sectors(chunk, None, first_sector, sector_size, encrypting))
+
+
+def _process_shared_chunk(encrypting, name, offset, length, iv, counter):
+    # Encrypt a slice of a shared memory segment in place, only the byte count goes back
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        with segment.buf[offset:offset + length] as chunk:
+            _worker_cipher.iv = iv
+            _worker_cipher.counter = counter
+            _worker_cipher.process_buffer(chunk, chunk, encrypting)
+    finally:
+        segment.close()
+    return length
+
+
+class SkinnyParallel:
+    """
+    Bulk encryption and decryption of large buffers across a pool of worker processes.
+    ECB and CTR are split across workers in both directions, CBC and CFB when decrypting.
+    Every other mode runs serially in the calling process. Output is byte identical to
+    SkinnyCipher.encrypt_buffer/decrypt_buffer and the chaining state of the cipher is
+    advanced the same way. Independent storage sectors are always split across workers.
+    """
+
+    def __init__(self, cipher, workers=None, chunk_size=1 << 20, shared=False):
+        """
+        Initialize a worker pool around a keyed cipher.
+        :param cipher: SkinnyCipher instance, its expanded key is sent to every worker once
+        :param workers: Int number of worker processes, defaults to the number of CPUs
+        :param chunk_size: Int number of bytes handed to a worker per task
+        :param shared: Bool, move plain buffers through one temporary shared memory segment processed in place
+                       by the workers instead of pickling every chunk and its result. SharedMemory segments
+                       passed as dst are always processed in place, without the temporary segment
+        :return: None
+        """
+        block_bytes = cipher.block_size >> 3
+        if not isinstance(chunk_size, int) or chunk_size <= 0 or chunk_size % block_bytes:
+            print('Invalid chunk size!')
+            print('Please Provide a positive multiple of', block_bytes, 'bytes')
+            raise ValueError('Chunk size must be a positive multiple of the block size')
+
+        self.cipher = cipher
+        self.chunk_size = chunk_size
+        self.block_bytes = block_bytes
+        self.shared = shared
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cipher,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def parallel(self, encrypting):
+        if self.cipher.mode in ('ECB', 'CTR'):
+            return True
+        return not encrypting and self.cipher.mode in ('CBC', 'CFB')
+
+    def chunk_states(self, src, length, encrypting):
+        # Chaining state at the start of every chunk, derived without running the cipher
+        blocks_per_chunk = self.chunk_size // self.block_bytes
+        states = []
+        for chunk_num, offset in enumerate(range(0, length, self.chunk_size)):
+            counter = (self.cipher.counter + chunk_num * blocks_per_chunk) & self.cipher.block_mask
+            iv = self.cipher.iv
+            if offset and not encrypting and self.cipher.mode in ('CBC', 'CFB'):
+                iv = self.cipher.unpack_block(src, offset - self.block_bytes)
+            states.append((offset, iv, counter))
+        return states
+
+    def advance_state(self, src, length):
+        # Leave the cipher where a serial pass over the buffer would have left it
+        block_count = length // self.block_bytes
+        if self.cipher.mode == 'CTR':
+            self.cipher.counter = (self.cipher.counter + block_count) & self.cipher.block_mask
+        elif self.cipher.mode in ('CBC', 'CFB') and block_count:
+            self.cipher.iv = self.cipher.unpack_block(src, length - self.block_bytes)
+
+    def process_buffer(self, src, dst, encrypting):
+        # Shared memory segments are processed through their buffers, a dst segment in place by the workers
+        segment = dst if isinstance(dst, shared_memory.SharedMemory) else None
+        if isinstance(src, shared_memory.SharedMemory):
+            src = src.buf
+        if segment is not None:
+            dst = segment.buf
+
+        if not self.parallel(encrypting):
+            dst = self.cipher.process_buffer(src, dst, encrypting)
+            return segment if segment is not None else dst
+
+        dst, length = self.cipher.prepare_buffers(src, dst)
+        if segment is not None:
+            if length:
+                self.process_segment(src, segment, length, encrypting)
+            return segment
+        if self.shared and length:
+            return self.process_shared(src, dst, length, encrypting)
+
+        with memoryview(src) as src_view:
+            # Chunks are copied out before anything is written, so dst may be src
+            states = self.chunk_states(src_view, length, encrypting)
+            futures = [self.executor.submit(_process_chunk, encrypting,
+                                            bytes(src_view[offset:offset + self.chunk_size]), iv, counter)
+                       for offset, iv, counter in states]
+            self.advance_state(src_view, length)
+
+        with memoryview(dst) as dst_view, dst_view.cast('B') as dst_bytes:
+            for (offset, iv, counter), future in zip(states, futures):
+                result = future.result()
+                dst_bytes[offset:offset + len(result)] = result
+        return dst
+
+    def process_segment(self, src, segment, length, encrypting):
+        """
+        Process a buffer into a shared memory segment, the workers encrypt the segment in place.
+        :param src: Buffer protocol object, may be the buffer of segment itself, then nothing is copied
+        :param segment: multiprocessing.shared_memory.SharedMemory of at least length bytes receiving the output
+        :param length: Int number of bytes to process
+        :param encrypting: Bool, True to encrypt and False to decrypt
+        :return: None
+        """
+        with memoryview(src) as src_view, src_view.cast('B') as src_bytes:
+            # Chaining state is taken from the source before any worker overwrites it
+            states = self.chunk_states(src_bytes, length, encrypting)
+            self.advance_state(src_bytes, length)
+            if src is not segment.buf:
+                segment.buf[:length] = src_bytes
+
+        futures = [self.executor.submit(_process_shared_chunk, encrypting, segment.name, offset,
+                                        min(self.chunk_size, length - offset), iv, counter)
+                   for offset, iv, counter in states]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            # Workers must be done with the segment before the caller may release it
+            wait(futures)
+
+    def process_shared(self, src, dst, length, encrypting):
+        # Plain buffers are moved through a temporary segment, which costs a copy in and a copy out.
+        # Callers holding their data in a SharedMemory segment pass it as dst to avoid both
+        segment = shared_memory.SharedMemory(create=True, size=length)
+        try:
+            self.process_segment(src, segment, length, encrypting)
+            with memoryview(dst) as dst_view, dst_view.cast('B') as dst_bytes:
+                dst_bytes[:length] = segment.buf[:length]
+        finally:
+            segment.close()
+            segment.unlink()
+        return dst
+
+    def process_sectors(self, src, dst, first_sector, sector_size, encrypting):
+        dst, length = self.cipher.prepare_buffers(src, dst)
+        self.cipher.check_sectors(length, first_sector, sector_size)
+
+        # Tasks hold whole sectors, so no sector is ever split between workers
+        chunk_size = max(self.chunk_size // sector_size, 1) * sector_size
+        with memoryview(src) as src_view, src_view.cast('B') as src_bytes:
+            futures = [self.executor.submit(_process_sectors, encrypting, bytes(src_bytes[offset:offset + chunk_size]),
+                                            first_sector + offset // sector_size, sector_size)
+                       for offset in range(0, length, chunk_size)]
+
+        with memoryview(dst) as dst_view, dst_view.cast('B') as dst_bytes:
+            for offset, future in zip(range(0, length, chunk_size), futures):
+                result = future.result()
+                dst_bytes[offset:offset + len(result)] = result
+        return dst
+
+    def encrypt_sectors(self, src, first_sector, sector_size, dst=None):
+        """
+        Encrypt consecutive storage sectors across the worker pool, see SkinnyCipher.encrypt_sectors.
+        :param src: Buffer protocol object holding whole sectors
+        :param first_sector: Int sector number of the first sector in src
+        :param sector_size: Int number of bytes per sector, a multiple of the block size
+        :param dst: Optional writable buffer for the ciphertext
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_sectors(src, dst, first_sector, sector_size, True)
+
+    def decrypt_sectors(self, src, first_sector, sector_size, dst=None):
+        """
+        Decrypt consecutive storage sectors across the worker pool, see SkinnyCipher.decrypt_sectors.
+        :param src: Buffer protocol object holding whole sectors
+        :param first_sector: Int sector number of the first sector in src
+        :param sector_size: Int number of bytes per sector, a multiple of the block size
+        :param dst: Optional writable buffer for the plaintext
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_sectors(src, dst, first_sector, sector_size, False)
+
+    def encrypt_buffer(self, src, dst=None):
+        """
+        Encrypt every block of a bytes-like object across the worker pool.
+        :param src: Buffer protocol object or SharedMemory segment holding whole blocks
+        :param dst: Optional writable buffer for the ciphertext, or a SharedMemory segment the workers write
+                    in place without any copy through the parent, src may be the same segment
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_buffer(src, dst, True)
+
+    def decrypt_buffer(self, src, dst=None):
+        """
+        Decrypt every block of a bytes-like object across the worker pool.
+        :param src: Buffer protocol object or SharedMemory segment holding whole blocks
+        :param dst: Optional writable buffer for the plaintext, or a SharedMemory segment the workers write
+                    in place without any copy through the parent, src may be the same segment
+        :return: dst, or a new bytearray when no dst was given
+        """
+        return self.process_buffer(src, dst, False)
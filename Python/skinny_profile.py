@@ -0,0 +1,156 @@
+from __future__ import print_function
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from skinny import SkinnyCipher, SkinnyModes
+
+
+class SkinnyProfiler:
+    """
+    Opt-in instrumentation of SkinnyCipher. While instrument() is active, timed variants of the key schedule,
+    state conversion and round methods are swapped into the classes and blocks are counted per mode, on exit
+    the original methods are put back. Nothing is patched outside of instrument(), so the normal code paths
+    carry no instrumentation overhead. Ciphers created inside the block keep their bound block functions
+    afterwards, those fall through to the original methods once the profiler is inactive.
+    Worker processes (SkinnyParallel) are not instrumented.
+    """
+
+    # SkinnyCipher methods timed per category, category: method names
+    timed_methods = {'key_schedule': ['expand_key', 'setup_state_engine', 'setup_table_engine',
+                                      'setup_unrolled_engine', 'setup_bitslice_engine', 'setup_numpy_engine',
+                                      'swar_engine_keys', 'tweak_round_keys'],
+                     'conversion': ['int_to_state', 'state_to_int', 'load_state', 'store_state',
+                                    'bitslice_blocks', 'unbitslice_blocks',
+                                    'numpy_blocks_to_cells', 'numpy_bytes_to_cells', 'numpy_cells_to_blocks'],
+                     'rounds': ['encrypt_function', 'decrypt_function', 'table_encrypt', 'table_decrypt',
+                                'swar_encrypt', 'swar_decrypt',
+                                'bitsliced_encrypt_function', 'bitsliced_decrypt_function',
+                                'numpy_encrypt_function', 'numpy_decrypt_function']}
+
+    # SkinnyModes entry points whose blocks are counted, only the outermost call of a thread counts
+    counted_methods = ['encrypt', 'decrypt', 'process_buffer', 'process_sectors']
+
+    def __init__(self, callback=None):
+        """
+        Initialize a profiler.
+        :param callback: Optional callable(category, name, seconds) run after every timed call, e.g. to sample
+                         or catch latency spikes as they happen
+        :return: None
+        """
+        self.callback = callback
+        self.active = False
+        self.nesting = threading.local()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counters.
+        :return: None
+        """
+        self.blocks = {}
+        self.timings = {}
+
+    def record(self, category, name, seconds):
+        calls, total, longest = self.timings.get((category, name), (0, 0.0, 0.0))
+        self.timings[(category, name)] = (calls + 1, total + seconds, max(longest, seconds))
+        if self.callback is not None:
+            self.callback(category, name, seconds)
+
+    def timed(self, category, name, function):
+        profiler = self
+
+        def instrumented(*args, **kwargs):
+            # Conversions run by the key schedule belong to the key schedule, only the outermost call is timed
+            if not profiler.active or getattr(profiler.nesting, 'timing', False):
+                return function(*args, **kwargs)
+            profiler.nesting.timing = True
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                profiler.nesting.timing = False
+                profiler.record(category, name, elapsed)
+        return instrumented
+
+    def counted(self, name, function):
+        profiler = self
+
+        def instrumented(cipher, *args, **kwargs):
+            # Buffer calls run the single block calls of chained modes, only the outer call counts
+            depth = getattr(profiler.nesting, 'depth', 0)
+            if not profiler.active or depth:
+                return function(cipher, *args, **kwargs)
+            profiler.nesting.depth = 1
+            try:
+                result = function(cipher, *args, **kwargs)
+            finally:
+                profiler.nesting.depth = 0
+            if name in ('encrypt', 'decrypt'):
+                blocks = 1
+            else:
+                with memoryview(args[0]) as view:
+                    blocks = view.nbytes // (cipher.block_size >> 3)
+            mode = 'sectors' if name == 'process_sectors' else cipher.mode
+            profiler.blocks[mode] = profiler.blocks.get(mode, 0) + blocks
+            return result
+        return instrumented
+
+    @contextmanager
+    def instrument(self, *ciphers):
+        """
+        Instrument SkinnyCipher for the duration of a with block.
+        :param ciphers: SkinnyCipher instances created before the block whose table, swar or unrolled engine
+                        block functions should be timed as well, their bound functions predate the swap
+        :return: Context manager yielding the profiler
+        """
+        if self.active:
+            print('Profiler is already instrumenting!')
+            raise ValueError('Profiler is already active')
+
+        patched = []
+        for category, names in self.timed_methods.items():
+            for name in names:
+                patched.append((SkinnyCipher, name, SkinnyCipher.__dict__[name]))
+                setattr(SkinnyCipher, name, self.timed(category, name, SkinnyCipher.__dict__[name]))
+        for name in self.counted_methods:
+            patched.append((SkinnyModes, name, SkinnyModes.__dict__[name]))
+            setattr(SkinnyModes, name, self.counted(name, SkinnyModes.__dict__[name]))
+
+        rebound = []
+        for cipher in ciphers:
+            if cipher.engine in ('table', 'swar'):
+                rebound.append((cipher, cipher.encrypt_block, cipher.decrypt_block))
+                cipher.encrypt_block = getattr(cipher, cipher.engine + '_encrypt')
+                cipher.decrypt_block = getattr(cipher, cipher.engine + '_decrypt')
+            elif cipher.engine == 'unrolled':
+                # Generated functions are not methods of the class, they are wrapped per cipher
+                rebound.append((cipher, cipher.encrypt_block, cipher.decrypt_block))
+                cipher.encrypt_block = self.timed('rounds', 'unrolled_encrypt', cipher.encrypt_block)
+                cipher.decrypt_block = self.timed('rounds', 'unrolled_decrypt', cipher.decrypt_block)
+
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+            for cipher, encrypt_block, decrypt_block in rebound:
+                cipher.encrypt_block = encrypt_block
+                cipher.decrypt_block = decrypt_block
+            for owner, name, original in reversed(patched):
+                setattr(owner, name, original)
+
+    def summary(self):
+        """
+        Counters collected so far.
+        :return: Dict of blocks per mode, seconds and calls per category, and calls, seconds and
+                 max_seconds per method
+        """
+        seconds = dict((category, 0.0) for category in self.timed_methods)
+        calls = dict((category, 0) for category in self.timed_methods)
+        methods = {}
+        for (category, name), (count, total, longest) in self.timings.items():
+            seconds[category] += total
+            calls[category] += count
+            methods[name] = {'calls': count, 'seconds': total, 'max_seconds': longest}
+        return {'blocks': dict(self.blocks), 'seconds': seconds, 'calls': calls, 'methods': methods}
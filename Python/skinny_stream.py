@@ -0,0 +1,252 @@
+from __future__ import print_function
+import mmap
+import os
+import stat
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter
+
+
+class SkinnyStream:
+    """
+    Chunked encryption and decryption of arbitrarily long byte streams over a SkinnyCipher or SkinnyContext.
+    Whole blocks go through the buffer interface as chunks arrive and the mode state of the cipher carries
+    over from chunk to chunk, so memory use only depends on the chunk size. The final partial block is
+    handled by PKCS#7 padding, by ciphertext stealing (CBC-CS2 and its ECB analogue) or, in the CTR, CFB
+    and OFB stream modes, by truncating the last keystream block.
+    """
+
+    __valid_paddings = [None, 'pkcs7', 'cts']
+
+    def __init__(self, cipher, padding=None, chunk_size=1 << 20):
+        """
+        Initialize a streaming layer around a keyed cipher.
+        :param cipher: SkinnyCipher or SkinnyContext, its iv and counter advance as data is processed
+        :param padding: None, 'pkcs7' or 'cts' (ciphertext stealing, ECB and CBC only)
+        :param chunk_size: Int number of bytes read per chunk by encrypt_stream/decrypt_stream
+        :return: None
+        """
+        if padding not in self.__valid_paddings:
+            print('Invalid padding!')
+            print('Please use one of the following paddings:', self.__valid_paddings)
+            raise ValueError('Unsupported padding')
+        if padding == 'cts' and cipher.mode == 'PCBC':
+            print('Invalid padding for cipher mode!')
+            print('Ciphertext stealing is supported in the following block cipher modes:', ['ECB', 'CBC'])
+            raise ValueError('Ciphertext stealing is not supported in PCBC mode')
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            print('Invalid chunk size!')
+            print('Please Provide a positive int')
+            raise ValueError('Chunk size must be positive')
+
+        self.cipher = cipher
+        self.padding = padding
+        self.chunk_size = chunk_size
+        self.block_bytes = cipher.block_size >> 3
+        self.stats = {'bytes_in': 0, 'bytes_out': 0, 'cipher_seconds': 0.0}
+
+    def keystream_mode(self):
+        return self.cipher.mode in ('CTR', 'CFB', 'OFB')
+
+    def reserve(self, encrypting):
+        # Bytes held back until the end of the stream is known, on top of any partial block
+        if self.padding == 'cts' and not self.keystream_mode():
+            return self.block_bytes
+        if self.padding == 'pkcs7' and not encrypting:
+            return self.block_bytes
+        return 0
+
+    def process(self, data, encrypting):
+        if not len(data):
+            return b''
+        function = self.cipher.encrypt_buffer if encrypting else self.cipher.decrypt_buffer
+        return bytes(function(data))
+
+    def begin(self, encrypting):
+        """
+        Start a new stream, for feeding chunks one at a time with update and finalize.
+        :param encrypting: Bool, True to encrypt and False to decrypt
+        :return: None
+        """
+        self.stats = {'bytes_in': 0, 'bytes_out': 0, 'cipher_seconds': 0.0}
+        self.encrypting = encrypting
+        self.pending = bytearray()
+
+    def update(self, chunk):
+        """
+        Process the next chunk of the stream started by begin.
+        :param chunk: bytes-like object of any size
+        :return: bytes of output that became available
+        """
+        start = perf_counter()
+        reserve = self.reserve(self.encrypting)
+        with memoryview(chunk) as view, view.cast('B') as data:
+            self.stats['bytes_in'] += len(data)
+
+            # Aligned data is processed straight from the chunk, only the unaligned tail is copied
+            if self.pending:
+                self.pending += data
+                ready = max((len(self.pending) - reserve) // self.block_bytes, 0) * self.block_bytes
+                output = self.process(self.pending[:ready], self.encrypting)
+                del self.pending[:ready]
+            else:
+                ready = max((len(data) - reserve) // self.block_bytes, 0) * self.block_bytes
+                output = self.process(data[:ready], self.encrypting)
+                self.pending += data[ready:]
+        self.stats['cipher_seconds'] += perf_counter() - start
+        self.stats['bytes_out'] += len(output)
+        return output
+
+    def finalize(self):
+        """
+        End the stream started by begin, padding or stealing the final block.
+        :return: bytes of the remaining output
+        """
+        start = perf_counter()
+        output = self.finish(bytes(self.pending), self.encrypting)
+        self.pending = bytearray()
+        self.stats['cipher_seconds'] += perf_counter() - start
+        self.stats['bytes_out'] += len(output)
+        return output
+
+    def iter_process(self, chunks, encrypting):
+        self.begin(encrypting)
+        for chunk in chunks:
+            output = self.update(chunk)
+            if output:
+                yield output
+        output = self.finalize()
+        if output:
+            yield output
+
+    def finish(self, final, encrypting):
+        if self.padding == 'pkcs7':
+            return self.finish_padded(final, encrypting)
+
+        partial_length = len(final) % self.block_bytes
+        if not partial_length:
+            return self.process(final, encrypting)
+
+        # A partial block in a stream mode only uses the first bytes of one more keystream block
+        if self.keystream_mode():
+            keystream = self.cipher.encrypt(0).to_bytes(self.block_bytes, 'big')
+            head = self.process(final[:-partial_length], encrypting)
+            return head + bytes(bytearray(a ^ b for a, b in zip(final[-partial_length:], keystream)))
+
+        if self.padding == 'cts' and len(final) > self.block_bytes:
+            return self.steal(final, encrypting)
+
+        print('Invalid stream length!')
+        print('Please Provide whole', self.block_bytes, 'byte blocks or use padding=\'pkcs7\'',
+              'or padding=\'cts\' for streams longer than one block')
+        raise ValueError('Stream length is not a multiple of the block size')
+
+    def finish_padded(self, final, encrypting):
+        if encrypting:
+            pad_length = self.block_bytes - len(final) % self.block_bytes
+            return self.process(final + bytes(bytearray([pad_length] * pad_length)), encrypting)
+
+        plaintext = self.process(final, encrypting) if final and not len(final) % self.block_bytes else b''
+        pad_length = plaintext[-1] if plaintext else 0
+        if not 0 < pad_length <= self.block_bytes or plaintext[-pad_length:] != bytes(bytearray([pad_length]) * pad_length):
+            print('Invalid padding!')
+            print('Ciphertext is truncated, corrupted or was not PKCS#7 padded')
+            raise ValueError('Invalid PKCS#7 padding')
+        return plaintext[:-pad_length]
+
+    def steal(self, final, encrypting):
+        # CBC-CS2 (or its ECB analogue) over the last full block and the partial block behind it,
+        # the two ciphertext blocks are swapped and the second to last is truncated
+        partial_length = len(final) - self.block_bytes
+        if encrypting:
+            penultimate = self.cipher.encrypt(int.from_bytes(final[:self.block_bytes], 'big'))
+            penultimate = penultimate.to_bytes(self.block_bytes, 'big')
+            stolen = penultimate[partial_length:] if self.cipher.mode == 'ECB' else bytes(self.block_bytes - partial_length)
+            last = self.cipher.encrypt(int.from_bytes(final[self.block_bytes:] + stolen, 'big'))
+            return last.to_bytes(self.block_bytes, 'big') + penultimate[:partial_length]
+
+        raw = self.cipher.decrypt_block(int.from_bytes(final[:self.block_bytes], 'big')).to_bytes(self.block_bytes, 'big')
+        truncated = final[self.block_bytes:]
+        penultimate = truncated + raw[partial_length:]
+        last = raw[:partial_length]
+        if self.cipher.mode == 'CBC':
+            last = bytes(bytearray(a ^ b for a, b in zip(last, truncated)))
+        plaintext = self.cipher.decrypt(int.from_bytes(penultimate, 'big')).to_bytes(self.block_bytes, 'big')
+        return plaintext + last
+
+    def iter_encrypt(self, chunks):
+        """
+        Encrypt an iterable of bytes-like chunks of any sizes.
+        :param chunks: Iterable of bytes-like objects
+        :return: Generator of ciphertext bytes chunks
+        """
+        return self.iter_process(chunks, True)
+
+    def iter_decrypt(self, chunks):
+        """
+        Decrypt an iterable of bytes-like chunks of any sizes.
+        :param chunks: Iterable of bytes-like objects
+        :return: Generator of plaintext bytes chunks
+        """
+        return self.iter_process(chunks, False)
+
+    @contextmanager
+    def input_chunks(self, reader, chunk_size):
+        # Regular files are mapped into memory and handed out as views, everything else is read
+        try:
+            fileno = reader.fileno()
+            file_stat = os.fstat(fileno)
+            regular = stat.S_ISREG(file_stat.st_mode) and file_stat.st_size > 0
+        except (AttributeError, OSError, ValueError):
+            regular = False
+        if not regular:
+            yield iter(partial(reader.read, chunk_size), b'')
+            return
+
+        start = reader.tell()
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        chunks = self.mapped_chunks(mapped, start, chunk_size)
+        try:
+            yield chunks
+        finally:
+            # Views into the mapping must be released before it can be closed
+            chunks.close()
+            mapped.close()
+        reader.seek(0, os.SEEK_END)
+
+    def mapped_chunks(self, mapped, start, chunk_size):
+        with memoryview(mapped) as view:
+            for offset in range(start, len(mapped), chunk_size):
+                with view[offset:offset + chunk_size] as chunk:
+                    yield chunk
+
+    def process_stream(self, reader, writer, chunk_size, encrypting):
+        start = perf_counter()
+        with self.input_chunks(reader, chunk_size or self.chunk_size) as chunks:
+            for output in self.iter_process(chunks, encrypting):
+                writer.write(output)
+        seconds = perf_counter() - start
+        stats = dict(self.stats)
+        stats['seconds'] = seconds
+        stats['throughput'] = stats['bytes_in'] / seconds if seconds else 0.0
+        return stats
+
+    def encrypt_stream(self, reader, writer, chunk_size=None):
+        """
+        Encrypt everything a binary reader yields into a binary writer.
+        :param reader: Binary file object, regular files are memory mapped from their current position
+        :param writer: Binary file object
+        :param chunk_size: Optional Int number of bytes per chunk, defaults to the chunk_size of the stream
+        :return: Dict of bytes_in, bytes_out, cipher_seconds, seconds and throughput (input bytes per second)
+        """
+        return self.process_stream(reader, writer, chunk_size, True)
+
+    def decrypt_stream(self, reader, writer, chunk_size=None):
+        """
+        Decrypt everything a binary reader yields into a binary writer.
+        :param reader: Binary file object, regular files are memory mapped from their current position
+        :param writer: Binary file object
+        :param chunk_size: Optional Int number of bytes per chunk, defaults to the chunk_size of the stream
+        :return: Dict of bytes_in, bytes_out, cipher_seconds, seconds and throughput (input bytes per second)
+        """
+        return self.process_stream(reader, writer, chunk_size, False)